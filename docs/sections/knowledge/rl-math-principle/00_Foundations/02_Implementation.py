@@ -10,10 +10,21 @@ $$ \mathbb{E}[f(X)] = \int f(x) p(x) dx \approx \frac{1}{N} \sum_{i=1}^N f(x_i)
 因为我们通常无法直接计算积分 (环境动态未知)，只能通过与环境交互收集 Experience Replay 来近似期望。
 """
 
+import sys
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
 import numpy as np
 import matplotlib.pyplot as plt
 from dataclasses import dataclass
-from typing import Callable, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import resource  # 仅 Unix 可用，用于读取进程峰值 RSS
+except ImportError:  # pragma: no cover - Windows
+    resource = None
 
 # ============================================
 # 第一部分: 配置与环境定义
@@ -25,6 +36,17 @@ class ExperimentConfig:
     num_samples: int = 10000    # 采样数量
     true_mean: float = 0.0      # 真实均值 (用于验证)
     true_std: float = 1.0       # 真实标准差
+    sampler: str = 'iid'        # 采样后端, 见 SAMPLERS
+    seed: Optional[int] = None  # 随机种子
+
+@dataclass
+class StreamingConfig:
+    """流式 (常数内存) 蒙特卡洛实验配置"""
+    num_samples: int = 10**8      # 总采样数量 N (可以远大于内存容量)
+    chunk_size: int = 2**20       # 每次抽取的样本块大小, 内存占用 O(chunk_size)
+    num_trace_points: int = 200   # 收敛曲线的降采样点数 (对数间隔)
+    confidence: float = 0.95      # 置信区间水平
+    seed: int = 42
 
 def target_function(x: np.ndarray) -> np.ndarray:
     """
@@ -34,13 +56,108 @@ def target_function(x: np.ndarray) -> np.ndarray:
     """
     return x ** 2
 
+def surrogate_function(x: np.ndarray) -> np.ndarray:
+    """
+    控制变量所用的代理函数 h(x) = |x|。
+    它与 f(x) = x^2 高度相关, 且期望已知: E|X| = sqrt(2/π)。
+    """
+    return np.abs(x)
+
+SURROGATE_MEAN = float(np.sqrt(2 / np.pi))
+
+def expensive_target_function(x: np.ndarray) -> np.ndarray:
+    """
+    与 target_function 数值相同 (sin^2 + cos^2 = 1), 但人为增加了计算量,
+    用来模拟昂贵的仿真器或奖励模型, 此时并行采样的收益最明显。
+    """
+    acc = np.zeros_like(x)
+    for k in range(1, 33):
+        acc += np.sin(k * x) ** 2 + np.cos(k * x) ** 2
+    return x ** 2 * acc / 32
+
 # ============================================
 # 第二部分: 核心算法实现
 # ============================================
 
+def _uniform_to_normal(u: np.ndarray) -> np.ndarray:
+    """逆变换采样: x = Φ^{-1}(u), 把 [0,1) 上的 (分层/低差异) 点映射为 N(0,1) 样本"""
+    from scipy.special import ndtri
+    eps = np.finfo(np.float64).tiny
+    return ndtri(np.clip(u, eps, 1.0 - np.finfo(np.float64).eps))
+
+def _sample_iid(num_samples, func, rng, **_) -> Tuple[np.ndarray, np.ndarray]:
+    """普通 i.i.d. 采样: x_i ~ N(0, 1)"""
+    samples = rng.standard_normal(num_samples)
+    return samples, func(samples)
+
+def _sample_antithetic(num_samples, func, rng, **_) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    对偶变量: 成对使用 (z, -z)。
+    两者同分布, 当 f 单调时 Cov(f(z), f(-z)) < 0, 方差下降;
+    但对偶函数 (如 x^2) 有 f(z) = f(-z), 反而浪费一半样本。
+    """
+    half = rng.standard_normal((num_samples + 1) // 2)
+    samples = np.stack([half, -half], axis=1).reshape(-1)[:num_samples]
+    return samples, func(samples)
+
+def _sample_control_variate(
+    num_samples, func, rng,
+    surrogate: Callable[[np.ndarray], np.ndarray] = surrogate_function,
+    surrogate_mean: float = SURROGATE_MEAN, **_
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    控制变量: y_i = f(x_i) - c (h(x_i) - E[h])
+    最优系数 c* = Cov(f, h) / Var(h), 方差降为 (1 - ρ^2) Var(f)。
+    这里 c 用同一批样本估计, 由此引入的偏差为 O(1/N)。
+    """
+    samples = rng.standard_normal(num_samples)
+    values = func(samples)
+    h = surrogate(samples)
+    h_centered = h - h.mean()
+    denom = np.dot(h_centered, h_centered)
+    c = np.dot(values - values.mean(), h_centered) / denom if denom > 0 else 0.0
+    return samples, values - c * (h - surrogate_mean)
+
+def _sample_stratified(num_samples, func, rng, num_strata: int = 64, **_) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    分层采样: 把 [0,1) 均分为 K 层, 第 i 个样本落在第 (i mod K) 层:
+        u_i = (i mod K + U_i) / K,  x_i = Φ^{-1}(u_i)
+    每 K 个样本恰好覆盖所有层一次, 消除了层间方差。
+    """
+    strata = np.arange(num_samples) % num_strata
+    u = (strata + rng.random(num_samples)) / num_strata
+    samples = _uniform_to_normal(u)
+    return samples, func(samples)
+
+def _sample_sobol(num_samples, func, rng, **_) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    加扰 Sobol 准蒙特卡洛: 低差异序列 + Owen 加扰 (保持无偏)。
+    对光滑被积函数误差接近 O(log N / N), 优于 i.i.d. 的 O(1/sqrt(N))。
+    点数取 2 的幂时平衡性最好。
+    """
+    from scipy.stats import qmc
+    sobol = qmc.Sobol(d=1, scramble=True, seed=rng)
+    m = int(np.ceil(np.log2(max(num_samples, 1))))
+    u = sobol.random_base2(m)[:num_samples, 0]
+    samples = _uniform_to_normal(u)
+    return samples, func(samples)
+
+# 可插拔的采样后端: name -> fn(num_samples, func, rng, **options) -> (samples, values)
+# values 的前缀平均即该后端的估计量
+SAMPLERS: Dict[str, Callable[..., Tuple[np.ndarray, np.ndarray]]] = {
+    'iid': _sample_iid,
+    'antithetic': _sample_antithetic,
+    'control_variate': _sample_control_variate,
+    'stratified': _sample_stratified,
+    'sobol': _sample_sobol,
+}
+
 def monte_carlo_expectation(
     num_samples: int, 
-    func: Callable[[np.ndarray], np.ndarray]
+    func: Callable[[np.ndarray], np.ndarray],
+    sampler: str = 'iid',
+    seed: Optional[int] = None,
+    **sampler_options
 ) -> Tuple[np.ndarray, np.ndarray]:
     """
     使用蒙特卡洛方法估计期望。
@@ -48,17 +165,22 @@ def monte_carlo_expectation(
     Args:
         num_samples: 采样点数 N
         func: 目标函数 f(x)
+        sampler: 采样后端 ('iid', 'antithetic', 'control_variate', 'stratified', 'sobol')
+        seed: 随机种子
+        sampler_options: 传给后端的额外参数 (如 num_strata, surrogate, surrogate_mean)
         
     Returns:
         estimates: 随样本数增加的估计值序列
         samples: 原始采样点
     """
+    if sampler not in SAMPLERS:
+        raise ValueError(f"Unknown sampler '{sampler}', expected one of {list(SAMPLERS)}")
+    rng = np.random.default_rng(seed)
+
     # 1. 从概率测度 P (这里是标准正态分布) 中采样 omega
     # 对应理论: \omega \sim P
-    samples = np.random.normal(loc=0, scale=1, size=num_samples)
-    
-    # 2. 计算函数值 f(X(\omega))
-    values = func(samples)
+    # 2. 计算函数值 f(X(\omega)) (方差缩减后端返回的是修正后的无偏项)
+    samples, values = SAMPLERS[sampler](num_samples, func, rng, **sampler_options)
     
     # 3. 计算累积平均值 (模拟样本量从 1 到 N 的过程)
     # 对应理论: \frac{1}{n} \sum_{i=1}^n f(x_i) \to \mathbb{E}[f(X)] (L.L.N)
@@ -68,6 +190,222 @@ def monte_carlo_expectation(
     
     return estimates, samples
 
+@dataclass
+class RunningMoments:
+    """
+    流式统计量: 样本数 n、部分和 S = Σ x_i、以及二阶中心矩 M2 = Σ (x_i - x̄)^2。
+
+    按块更新时使用 Welford 算法的成块形式 (Chan et al. 合并公式):
+        δ = x̄_b - x̄_a
+        M2 = M2_a + M2_b + δ^2 · n_a n_b / (n_a + n_b)
+    这样无需保存任何历史样本, 且比朴素的 Σx^2 - n x̄^2 数值稳定得多。
+    """
+    count: int = 0
+    total: float = 0.0
+    m2: float = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count > 0 else 0.0
+
+    @property
+    def variance(self) -> float:
+        """无偏样本方差 s^2 = M2 / (n - 1)"""
+        return self.m2 / (self.count - 1) if self.count > 1 else float('nan')
+
+    def merge(self, other: "RunningMoments") -> "RunningMoments":
+        """原地合并另一组统计量 (满足结合律, 可用于分块或多进程归并)"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.total, self.m2 = other.count, other.total, other.m2
+            return self
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 = self.m2 + other.m2 + delta * delta * self.count * other.count / n
+        self.count = n
+        self.total = self.total + other.total
+        return self
+
+    def update(self, values: np.ndarray) -> "RunningMoments":
+        """用一个样本块更新统计量"""
+        if values.size == 0:
+            return self
+        chunk_total = float(values.sum())
+        deviations = values - chunk_total / values.size
+        chunk = RunningMoments(int(values.size), chunk_total, float(np.dot(deviations, deviations)))
+        return self.merge(chunk)
+
+@dataclass
+class StreamingEstimate:
+    """流式蒙特卡洛估计结果"""
+    mean: float                     # 最终估计值 (1/N) Σ f(x_i)
+    std_error: float                # 标准误 s / sqrt(N)
+    ci_low: float                   # 置信区间下界
+    ci_high: float                  # 置信区间上界
+    num_samples: int
+    trace_counts: np.ndarray        # 降采样后的样本数 n_k
+    trace_estimates: np.ndarray     # 对应的累积估计值
+    trace_half_widths: np.ndarray   # 对应的置信区间半宽 z · s_k / sqrt(n_k)
+
+def streaming_monte_carlo_expectation(
+    num_samples: int,
+    func: Callable[[np.ndarray], np.ndarray],
+    chunk_size: int = 2**20,
+    num_trace_points: int = 200,
+    confidence: float = 0.95,
+    seed: Optional[int] = None
+) -> StreamingEstimate:
+    """
+    常数内存的流式蒙特卡洛估计。
+
+    与 monte_carlo_expectation 计算同一个量, 但每次只抽取 chunk_size 个样本,
+    用 RunningMoments 维护 (n, S, M2), 因此内存为 O(chunk_size) 而与 N 无关。
+    收敛曲线只在对数间隔的 num_trace_points 个检查点上记录 (降采样),
+    检查点落在块内时, 用块内前缀和精确还原该时刻的均值与方差。
+
+    置信区间使用中心极限定理的正态近似:
+        x̄_n ± z_{(1+c)/2} · s_n / sqrt(n)
+
+    Args:
+        num_samples: 总采样数 N
+        func: 目标函数 f(x), 需支持向量化输入
+        chunk_size: 每块样本数
+        num_trace_points: 收敛曲线的最大记录点数
+        confidence: 置信水平
+        seed: 随机种子
+
+    Returns:
+        StreamingEstimate
+    """
+    if num_samples < 1:
+        raise ValueError(f"num_samples must be >= 1, got {num_samples}")
+    rng = np.random.default_rng(seed)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    # 对数间隔的检查点 (1-based 样本计数), 最后一个点总是 N
+    checkpoints = np.unique(np.geomspace(1, num_samples, num_trace_points).astype(np.int64))
+    checkpoints[-1] = num_samples
+    trace_estimates = np.empty(checkpoints.size)
+    trace_half_widths = np.empty(checkpoints.size)
+    next_cp = 0
+
+    moments = RunningMoments()
+    buffer = np.empty(min(chunk_size, num_samples))
+
+    while moments.count < num_samples:
+        size = min(chunk_size, num_samples - moments.count)
+        samples = buffer[:size]
+        rng.standard_normal(out=samples)
+        values = np.asarray(func(samples), dtype=np.float64)
+
+        # 记录落在本块内的检查点 (只有命中时才付出前缀和的代价)
+        start = moments.count
+        hit_end = np.searchsorted(checkpoints, start + size, side='right')
+        if hit_end > next_cp:
+            k = checkpoints[next_cp:hit_end] - start            # 块内前缀长度
+            shift = values.mean()
+            centered = values - shift
+            prefix_s1 = np.cumsum(centered)[k - 1]
+            prefix_s2 = np.cumsum(centered * centered)[k - 1]
+            prefix_mean = shift + prefix_s1 / k
+            prefix_m2 = prefix_s2 - prefix_s1 * prefix_s1 / k
+
+            # 与之前的统计量合并 (向量化的 Chan 公式)
+            n = start + k
+            delta = prefix_mean - moments.mean
+            m2 = moments.m2 + prefix_m2 + delta * delta * start * k / n
+            with np.errstate(invalid='ignore', divide='ignore'):
+                variance = np.where(n > 1, m2 / (n - 1), np.nan)
+            trace_estimates[next_cp:hit_end] = (moments.total + prefix_s1 + shift * k) / n
+            trace_half_widths[next_cp:hit_end] = z * np.sqrt(variance / n)
+            next_cp = hit_end
+
+        moments.update(values)
+
+    std_error = float(np.sqrt(moments.variance / moments.count))
+    return StreamingEstimate(
+        mean=moments.mean,
+        std_error=std_error,
+        ci_low=moments.mean - z * std_error,
+        ci_high=moments.mean + z * std_error,
+        num_samples=moments.count,
+        trace_counts=checkpoints,
+        trace_estimates=trace_estimates,
+        trace_half_widths=trace_half_widths
+    )
+
+def _worker_moments(
+    num_samples: int,
+    func: Callable[[np.ndarray], np.ndarray],
+    seed_seq: np.random.SeedSequence,
+    chunk_size: int
+) -> RunningMoments:
+    """并行 worker: 用独立的随机流按块采样, 只返回 (n, S, M2) 三个数"""
+    rng = np.random.default_rng(seed_seq)
+    moments = RunningMoments()
+    buffer = np.empty(max(min(chunk_size, num_samples), 0))
+    while moments.count < num_samples:
+        samples = buffer[:min(chunk_size, num_samples - moments.count)]
+        rng.standard_normal(out=samples)
+        moments.update(np.asarray(func(samples), dtype=np.float64))
+    return moments
+
+def parallel_monte_carlo_expectation(
+    num_samples: int,
+    func: Callable[[np.ndarray], np.ndarray],
+    num_workers: int = 4,
+    seed: Optional[int] = None,
+    chunk_size: int = 2**20,
+    confidence: float = 0.95
+) -> StreamingEstimate:
+    """
+    多进程并行蒙特卡洛估计。
+
+    1. 用 np.random.SeedSequence(seed).spawn(W) 为每个 worker 派生统计独立的随机流;
+    2. num_samples 尽量均分给 W 个 worker, 每个 worker 返回 RunningMoments (n, S, M2);
+    3. 主进程按 worker 编号顺序用 Chan 公式精确合并。
+
+    由于随机流、样本划分和合并顺序都只取决于 (seed, num_workers),
+    给定这两个参数时结果逐比特可复现, 与进程调度无关。
+    func 必须可被 pickle (模块级函数)。
+
+    Returns:
+        StreamingEstimate, 其收敛曲线记录的是依次合并每个 worker 后的估计
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    child_seqs = np.random.SeedSequence(seed).spawn(num_workers)
+    base, extra = divmod(num_samples, num_workers)
+    counts = [base + (1 if i < extra else 0) for i in range(num_workers)]
+
+    if num_workers == 1:
+        partials = [_worker_moments(counts[0], func, child_seqs[0], chunk_size)]
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            partials = list(pool.map(
+                _worker_moments, counts, [func] * num_workers, child_seqs, [chunk_size] * num_workers
+            ))
+
+    moments = RunningMoments()
+    trace_counts, trace_estimates, trace_half_widths = [], [], []
+    for partial in partials:
+        moments.merge(partial)
+        trace_counts.append(moments.count)
+        trace_estimates.append(moments.mean)
+        trace_half_widths.append(z * np.sqrt(moments.variance / moments.count))
+
+    std_error = float(np.sqrt(moments.variance / moments.count))
+    return StreamingEstimate(
+        mean=moments.mean,
+        std_error=std_error,
+        ci_low=moments.mean - z * std_error,
+        ci_high=moments.mean + z * std_error,
+        num_samples=moments.count,
+        trace_counts=np.array(trace_counts),
+        trace_estimates=np.array(trace_estimates),
+        trace_half_widths=np.array(trace_half_widths)
+    )
+
 # ============================================
 # 第三部分: 可视化与验证
 # ============================================
@@ -77,7 +415,9 @@ def run_experiment():
     config = ExperimentConfig()
     
     # 运行估计
-    estimates, samples = monte_carlo_expectation(config.num_samples, target_function)
+    estimates, samples = monte_carlo_expectation(
+        config.num_samples, target_function, sampler=config.sampler, seed=config.seed
+    )
     
     final_estimate = estimates[-1]
     analytical_result = 1.0  # E[X^2] for N(0,1) is 1
@@ -104,5 +444,189 @@ def run_experiment():
     plt.savefig('convergence_plot.png')
     print(">>> 结果图已保存为 convergence_plot.png")
 
+def run_streaming_experiment(config: Optional[StreamingConfig] = None):
+    config = config or StreamingConfig()
+    print(">>> 开始流式 (常数内存) 蒙特卡洛实验...")
+    start = time.perf_counter()
+    result = streaming_monte_carlo_expectation(
+        config.num_samples,
+        target_function,
+        chunk_size=config.chunk_size,
+        num_trace_points=config.num_trace_points,
+        confidence=config.confidence,
+        seed=config.seed
+    )
+    elapsed = time.perf_counter() - start
+
+    print(f"采样数量: {result.num_samples:,} (块大小 {config.chunk_size:,})")
+    print(f"最终估计值: {result.mean:.6f} ± {result.std_error:.2e}")
+    print(f"{config.confidence:.0%} 置信区间: [{result.ci_low:.6f}, {result.ci_high:.6f}]")
+    print(f"吞吐量: {result.num_samples / elapsed / 1e6:.1f} M samples/s")
+
+    # 绘图: 对数横轴上的收敛曲线与置信带, 误差应按 1/sqrt(n) 收缩
+    plt.figure(figsize=(10, 6))
+    counts = result.trace_counts
+    plt.semilogx(counts, result.trace_estimates, label='Streaming Estimate', color='#1f77b4')
+    plt.fill_between(
+        counts,
+        result.trace_estimates - result.trace_half_widths,
+        result.trace_estimates + result.trace_half_widths,
+        color='#1f77b4', alpha=0.2, label=f'{config.confidence:.0%} CI'
+    )
+    plt.axhline(y=1.0, color='r', linestyle='--', label='Analytical Truth (Expectation)')
+    plt.title('Streaming Monte Carlo Convergence / 流式估计收敛')
+    plt.xlabel('Number of Samples (n, log scale)')
+    plt.ylabel('Estimated Expectation E[f(X)]')
+    plt.legend()
+    plt.grid(True, alpha=0.3)
+    plt.savefig('streaming_convergence_plot.png')
+    plt.close()
+    print(">>> 结果图已保存为 streaming_convergence_plot.png")
+
+def compare_samplers(
+    func: Callable[[np.ndarray], np.ndarray] = target_function,
+    true_value: float = 1.0,
+    tolerance: float = 2e-3,
+    num_replications: int = 16,
+    samplers: Tuple[str, ...] = tuple(SAMPLERS),
+    max_log2_samples: int = 24,
+    seed: int = 0
+) -> List[Dict]:
+    """
+    比较各采样后端达到目标精度所需的样本数与 CPU 时间。
+
+    对每个后端, 从 N = 2^8 开始倍增 N, 每个 N 独立重复 num_replications 次,
+    直到估计的均方根误差 RMSE <= tolerance。取 2 的幂也保证了 Sobol 点集的平衡性。
+
+    报告的 efficiency = 1 / (MSE · CPU 秒), 即 "单位 CPU 时间的精度",
+    数值越大说明该估计量越划算。
+    """
+    seed_seq = np.random.SeedSequence(seed)
+    rows = []
+    print(f"\n目标 RMSE <= {tolerance:g} ({num_replications} 次重复)")
+    print(f"{'sampler':>16} | {'samples':>10} | {'RMSE':>10} | {'CPU s/est':>10} | {'efficiency':>10}")
+    print("-" * 68)
+    for name in samplers:
+        child = seed_seq.spawn(1)[0]
+        row = None
+        for log2_n in range(8, max_log2_samples + 1):
+            n = 2 ** log2_n
+            seeds = child.spawn(num_replications)
+            start = time.process_time()
+            finals = np.array([
+                monte_carlo_expectation(n, func, sampler=name, seed=s)[0][-1] for s in seeds
+            ])
+            cpu_per_estimate = (time.process_time() - start) / num_replications
+            mse = float(np.mean((finals - true_value) ** 2))
+            row = {
+                "sampler": name,
+                "samples": n,
+                "rmse": np.sqrt(mse),
+                "cpu_seconds": cpu_per_estimate,
+                "efficiency": 1.0 / max(mse * cpu_per_estimate, 1e-300),
+                "reached": mse <= tolerance ** 2
+            }
+            if row["reached"]:
+                break
+        rows.append(row)
+        flag = "" if row["reached"] else " (未达到)"
+        print(f"{name:>16} | {row['samples']:>10,} | {row['rmse']:>10.2e} | "
+              f"{row['cpu_seconds']:>10.2e} | {row['efficiency']:>10.3e}{flag}")
+    return rows
+
+# ============================================
+# 第四部分: 内存与吞吐量基准测试
+# ============================================
+
+def _peak_rss_mb() -> float:
+    """当前进程的峰值常驻内存 (MB); 非 Unix 平台返回 nan"""
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB, macOS 单位为 Byte
+    return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+
+def _profile_estimator(mode: str, num_samples: int, chunk_size: int) -> Tuple[float, float, float]:
+    """在独立子进程中运行一次估计, 返回 (耗时秒数, 运行前峰值RSS, 运行后峰值RSS)"""
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    if mode == 'in_memory':
+        estimates, _ = monte_carlo_expectation(num_samples, target_function)
+        _ = estimates[-1]
+    else:
+        streaming_monte_carlo_expectation(num_samples, target_function, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+    return elapsed, baseline, _peak_rss_mb()
+
+def benchmark_memory_and_throughput(
+    sample_sizes: Tuple[int, ...] = (10**5, 10**6, 10**7),
+    chunk_size: int = 2**20
+) -> List[Dict]:
+    """
+    对比全内存路径与流式路径的峰值 RSS 和吞吐量。
+
+    每次测量都在一个全新的 spawn 子进程中完成, 保证峰值 RSS 互不污染。
+    全内存路径的额外内存约为 4 个长度为 N 的 float64 数组 (32N 字节),
+    流式路径的额外内存只与 chunk_size 有关。
+    """
+    ctx = mp.get_context('spawn')
+    rows = []
+    print(f"\n{'N':>12} | {'mode':>10} | {'samples/s':>12} | {'peak RSS':>10} | {'extra RSS':>10}")
+    print("-" * 66)
+    for n in sample_sizes:
+        for mode in ('in_memory', 'streaming'):
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                elapsed, baseline, peak = pool.submit(_profile_estimator, mode, n, chunk_size).result()
+            row = {
+                "num_samples": n,
+                "mode": mode,
+                "samples_per_sec": n / elapsed,
+                "peak_rss_mb": peak,
+                "extra_rss_mb": peak - baseline
+            }
+            rows.append(row)
+            print(f"{n:>12,} | {mode:>10} | {row['samples_per_sec']:>12.3e} | "
+                  f"{peak:>8.1f}MB | {row['extra_rss_mb']:>8.1f}MB")
+    return rows
+
+def benchmark_parallel_scaling(
+    num_samples: int = 2 * 10**6,
+    worker_counts: Tuple[int, ...] = (1, 2, 4),
+    func: Callable[[np.ndarray], np.ndarray] = expensive_target_function,
+    seed: int = 0
+) -> List[Dict]:
+    """
+    并行估计的加速比与可复现性。
+
+    对每个 worker 数重复运行两次相同 seed, 检查结果是否逐比特一致;
+    加速比以 1 个 worker 的墙钟时间为基准 (包含进程池启动开销,
+    因此 func 越昂贵, 加速比越接近线性)。
+    """
+    rows = []
+    print(f"\n并行蒙特卡洛 (N={num_samples:,}, 可用核数 {mp.cpu_count()})")
+    print(f"{'workers':>8} | {'seconds':>8} | {'speedup':>8} | {'estimate':>12} | {'bit-identical':>13}")
+    print("-" * 62)
+    baseline = None
+    for w in worker_counts:
+        start = time.perf_counter()
+        first = parallel_monte_carlo_expectation(num_samples, func, num_workers=w, seed=seed)
+        elapsed = time.perf_counter() - start
+        second = parallel_monte_carlo_expectation(num_samples, func, num_workers=w, seed=seed)
+        identical = first.mean == second.mean and first.std_error == second.std_error
+        baseline = baseline or elapsed
+        rows.append({
+            "workers": w,
+            "seconds": elapsed,
+            "speedup": baseline / elapsed,
+            "estimate": first.mean,
+            "bit_identical": identical
+        })
+        print(f"{w:>8} | {elapsed:>8.3f} | {baseline / elapsed:>7.2f}x | {first.mean:>12.8f} | {str(identical):>13}")
+    return rows
+
 if __name__ == "__main__":
     run_experiment()
+    run_streaming_experiment()
+    compare_samplers()
+    benchmark_memory_and_throughput()
+    benchmark_parallel_scaling()
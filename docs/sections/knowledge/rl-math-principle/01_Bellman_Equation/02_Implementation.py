@@ -8,9 +8,20 @@
 $$ V_{k+1}(s) = \max_a (R(s,a) + \gamma \sum_{s'} P(s'|s,a) V_k(s')) $$
 """
 
+import heapq
+import json
+import multiprocessing as mp
+import os
+import tempfile
+import time
 import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
 import matplotlib.pyplot as plt
-from typing import Dict, List, Tuple
+from dataclasses import dataclass
+from functools import cached_property
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple, Union
 
 # ============================================
 # 第一部分: 定义简单的 GridWorld MDP
@@ -18,22 +29,46 @@ from typing import Dict, List, Tuple
 
 class SimpleGridWorld:
     """
-    一个 3x3 的网格世界:
-    S = {(0,0), ..., (2,2)}
+    一个 rows x cols 的网格世界 (默认 3x3):
+    S = {(0,0), ..., (rows-1,cols-1)}
     A = {Up, Down, Left, Right}
-    Goal = (2,2) with Reward +1
-    Trap = (1,1) with Reward -1
+    Goal = (rows-1,cols-1) with Reward +1 (goal_reward)
+    Trap = (1,1) with Reward -1 (trap_reward)
     Step Reward = 0
     """
-    def __init__(self):
-        self.rows = 3
-        self.cols = 3
-        self.states = [(r, c) for r in range(self.rows) for c in range(self.cols)]
+    def __init__(
+        self,
+        rows: int = 3,
+        cols: int = 3,
+        goal_state: Optional[Tuple[int, int]] = None,
+        trap_state: Optional[Tuple[int, int]] = (1, 1),
+        gamma: float = 0.9,
+        goal_reward: float = 1.0,
+        trap_reward: float = -1.0
+    ):
+        self.rows = rows
+        self.cols = cols
         self.actions = ['Up', 'Down', 'Left', 'Right']
-        self.goal_state = (2, 2)
-        self.trap_state = (1, 1)
-        self.gamma = 0.9
+        self.goal_state = goal_state if goal_state is not None else (rows - 1, cols - 1)
+        self.trap_state = trap_state
+        self.gamma = gamma
+        self.goal_reward = goal_reward
+        self.trap_reward = trap_reward
         
+    @cached_property
+    def states(self) -> List[Tuple[int, int]]:
+        # 按需生成: 只用编译表的大网格不必物化 rows*cols 个元组
+        return [(r, c) for r in range(self.rows) for c in range(self.cols)]
+
+    @property
+    def num_states(self) -> int:
+        return self.rows * self.cols
+
+    def state_to_index(self, s: Tuple[int, int]) -> int:
+        """行优先编号: (r, c) -> r * cols + c"""
+        return s[0] * self.cols + s[1]
+
+
     def get_transition(self, s: Tuple[int, int], a: str) -> Tuple[Tuple[int, int], float]:
         """
         确定性转移: 返回 (next_state, reward)
@@ -52,20 +87,828 @@ class SimpleGridWorld:
         
         reward = 0.0
         if ns == self.goal_state:
-            reward = 1.0
+            reward = self.goal_reward
         elif ns == self.trap_state:
-            reward = -1.0
+            reward = self.trap_reward
             
         return ns, reward
 
+    def compile_rows(self, row_start: int, row_end: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        把第 [row_start, row_end) 行的状态编译为稠密转移表 (与 get_transition 逐项一致):
+            next_state[i, a]: 后继状态的行优先编号
+            reward[i, a]:     即时奖励
+        终止状态编码为奖励为 0 的自环。完全向量化, 不调用 get_transition。
+        """
+        r, c = np.divmod(np.arange(row_start * self.cols, row_end * self.cols, dtype=np.int64), self.cols)
+        # 动作顺序与 self.actions 一致: Up, Down, Left, Right
+        next_r = np.stack([np.maximum(r - 1, 0), np.minimum(r + 1, self.rows - 1), r, r], axis=1)
+        next_c = np.stack([c, c, np.maximum(c - 1, 0), np.minimum(c + 1, self.cols - 1)], axis=1)
+        next_state = next_r * self.cols + next_c
+
+        reward = np.zeros(next_state.shape)
+        terminal = np.zeros(r.shape, dtype=bool)
+        for special, value in ((self.goal_state, self.goal_reward), (self.trap_state, self.trap_reward)):
+            if special is None:
+                continue
+            idx = self.state_to_index(special)
+            reward[next_state == idx] = value
+            terminal |= (r * self.cols + c) == idx
+
+        next_state[terminal] = (r * self.cols + c)[terminal, None]
+        reward[terminal] = 0.0
+        return next_state, reward
+
+    def compile(self) -> "GridWorldTensors":
+        """一次性编译整个网格为 GridWorldTensors"""
+        next_state, reward = self.compile_rows(0, self.rows)
+        return GridWorldTensors(next_state, reward, self.gamma, (self.rows, self.cols))
+
+@dataclass
+class GridWorldTensors:
+    """
+    确定性 MDP 的稠密张量表示 (S 个状态, A 个动作):
+        next_state: [S, A] 后继状态编号
+        reward:     [S, A] 即时奖励 R(s, a)
+    贝尔曼最优算子因此变成一次 gather + 一次 max 归约:
+        V_{k+1} = max_a (reward + γ V_k[next_state])
+    """
+    next_state: np.ndarray
+    reward: np.ndarray
+    gamma: float
+    shape: Tuple[int, int]
+
+    @property
+    def num_states(self) -> int:
+        return self.next_state.shape[0]
+
+class SparseMDP:
+    """
+    通用 (随机) 有限 MDP, 每个动作的转移矩阵存为 CSR 稀疏矩阵:
+        P[a]: [S, S], P[a][s, s'] = P(s'|s, a)
+        R:    [A, S], R[a, s] = E[r | s, a] (期望即时奖励)
+
+    内存与非零元个数 nnz 成正比, 因此数百万个状态、每个状态只有少数
+    后继的 MDP 也能放进内存。贝尔曼最优算子是每个动作一次稀疏矩阵-向量乘:
+        Q[a] = R[a] + γ P[a] V,    V_new = max_a Q[a]
+    终止状态约定为奖励为 0 的自环。
+    """
+    def __init__(
+        self,
+        P: List[sp.csr_matrix],
+        R: np.ndarray,
+        gamma: float,
+        shape: Optional[Tuple[int, int]] = None
+    ):
+        self.P = [sp.csr_matrix(P_a) for P_a in P]
+        self.R = np.asarray(R, dtype=np.float64)
+        self.gamma = gamma
+        self.shape = shape  # 若来自网格世界, 记录 (rows, cols) 以便可视化
+
+        S = self.num_states
+        if self.R.shape != (len(self.P), S):
+            raise ValueError(f"R must have shape {(len(self.P), S)}, got {self.R.shape}")
+        for a, P_a in enumerate(self.P):
+            if P_a.shape != (S, S):
+                raise ValueError(f"P[{a}] must have shape {(S, S)}, got {P_a.shape}")
+            if not np.allclose(np.asarray(P_a.sum(axis=1)).ravel(), 1.0):
+                raise ValueError(f"Rows of P[{a}] must sum to 1")
+
+    @property
+    def num_states(self) -> int:
+        return self.R.shape[1]
+
+    @property
+    def num_actions(self) -> int:
+        return self.R.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        """转移矩阵与奖励占用的字节数 (∝ nnz)"""
+        return self.R.nbytes + sum(P_a.data.nbytes + P_a.indices.nbytes + P_a.indptr.nbytes for P_a in self.P)
+
+    def q_values(self, V: np.ndarray) -> np.ndarray:
+        """Q[a, s] = R[a, s] + γ Σ_s' P[a][s, s'] V(s')"""
+        return np.stack([self.R[a] + self.gamma * (self.P[a] @ V) for a in range(self.num_actions)])
+
+    @classmethod
+    def from_grid_world(cls, env: SimpleGridWorld, slip_prob: float = 0.0) -> "SparseMDP":
+        """
+        由网格世界构造 "打滑" 版本 (类似 FrozenLake):
+        以 1 - slip_prob 的概率执行意图动作, 各以 slip_prob / 2 的概率滑向两个垂直方向。
+        slip_prob = 0 时退化为确定性的 SimpleGridWorld。
+        """
+        next_state, reward = env.compile_rows(0, env.rows)
+        S = env.num_states
+        # 动作顺序 Up, Down, Left, Right; 垂直方向分别为 (Left, Right) 与 (Up, Down)
+        perpendicular = {0: (2, 3), 1: (2, 3), 2: (0, 1), 3: (0, 1)}
+        rows = np.arange(S)
+        P, R = [], np.empty((4, S))
+        for a in range(4):
+            outcomes = [(a, 1.0 - slip_prob)]
+            if slip_prob > 0:
+                outcomes += [(b, slip_prob / 2) for b in perpendicular[a]]
+            # COO -> CSR 时重复的 (s, s') 会被自动累加 (例如撞墙后都停在原地)
+            P.append(sp.csr_matrix(
+                (np.concatenate([np.full(S, p) for _, p in outcomes]),
+                 (np.tile(rows, len(outcomes)), np.concatenate([next_state[:, b] for b, _ in outcomes]))),
+                shape=(S, S)
+            ))
+            R[a] = sum(p * reward[:, b] for b, p in outcomes)
+        return cls(P, R, env.gamma, shape=(env.rows, env.cols))
+
 # ============================================
 # 第二部分: 价值迭代算法实现
 # ============================================
 
-def value_iteration(env: SimpleGridWorld, theta: float = 1e-4):
+@dataclass
+class ValueIterationResult:
+    """
+    求解器输出: V 为按状态编号排列的价值向量。
+    iterations: 同步/Gauss-Seidel 为扫描轮数, 优先级扫描为价值更新次数
+    backups: 计算 max_a Q(s, a) 的总次数 (贝尔曼回溯), 用于比较不同求解器的工作量
+    """
+    V: np.ndarray
+    iterations: int
+    backups: int = 0
+    policy: Optional[np.ndarray] = None  # 策略迭代类求解器给出的确定性策略 π(s)
+
+def vectorized_value_iteration(
+    model: GridWorldTensors,
+    theta: float = 1e-4,
+    max_iterations: int = 100000
+) -> ValueIterationResult:
+    """
+    张量化价值迭代 (同步 Jacobi 更新)。
+
+    每一轮只有一次 NumPy gather (V[next_state]) 和一次 max 归约,
+    Python 层的开销与状态数无关; 迭代序列与字典版本逐项一致。
+    内部先转置为 [A, S] 的连续布局: 对 4 个连续数组做逐元素 max
+    比在长度为 4 的末轴上归约快数倍。
+    """
+    next_state = np.ascontiguousarray(model.next_state.T)
+    reward = np.ascontiguousarray(model.reward.T)
+    V = np.zeros(model.num_states)
+    iteration = 0
+    while iteration < max_iterations:
+        new_V = (reward + model.gamma * V[next_state]).max(axis=0)
+        delta = np.abs(new_V - V).max()
+        V = new_V
+        iteration += 1
+        if delta < theta:
+            break
+    return ValueIterationResult(V, iteration, iteration * model.num_states)
+
+def sparse_value_iteration(
+    mdp: SparseMDP,
+    theta: float = 1e-4,
+    max_iterations: int = 100000
+) -> ValueIterationResult:
+    """稀疏 MDP 上的同步价值迭代: 每轮每个动作一次 CSR 矩阵-向量乘"""
+    V = np.zeros(mdp.num_states)
+    iteration = 0
+    while iteration < max_iterations:
+        new_V = mdp.R[0] + mdp.gamma * (mdp.P[0] @ V)
+        for a in range(1, mdp.num_actions):
+            np.maximum(new_V, mdp.R[a] + mdp.gamma * (mdp.P[a] @ V), out=new_V)
+        delta = np.abs(new_V - V).max()
+        V = new_V
+        iteration += 1
+        if delta < theta:
+            break
+    return ValueIterationResult(V, iteration, iteration * mdp.num_states)
+
+def _scalar_backup_tables(mdp: SparseMDP):
+    """把 CSR 结构转成 Python 列表: 逐状态的标量回溯在列表上比在 NumPy 小数组上快一个数量级"""
+    tables = [(P_a.indptr.tolist(), P_a.indices.tolist(), P_a.data.tolist()) for P_a in mdp.P]
+    return tables, mdp.R.tolist()
+
+def _backup(s: int, V: List[float], tables, R: List[List[float]], gamma: float) -> float:
+    """单个状态的贝尔曼最优回溯: max_a [R(s,a) + γ Σ_s' P(s'|s,a) V(s')]"""
+    best = -float('inf')
+    for a, (indptr, indices, data) in enumerate(tables):
+        expected = 0.0
+        for k in range(indptr[s], indptr[s + 1]):
+            expected += data[k] * V[indices[k]]
+        q = R[a][s] + gamma * expected
+        if q > best:
+            best = q
+    return best
+
+def gauss_seidel_value_iteration(
+    mdp: SparseMDP,
+    theta: float = 1e-4,
+    order: str = 'forward',
+    max_iterations: int = 100000
+) -> ValueIterationResult:
+    """
+    原地 (Gauss-Seidel) 价值迭代: 不再复制 new_V = V.copy(),
+    同一轮中先更新的状态立刻被后更新的状态使用, 价值沿扫描方向一轮传播很远。
+
+    Args:
+        order: 'forward' 按编号递增, 'backward' 递减, 'alternate' 两者交替 (对称 GS)。
+               当奖励位于编号较大的一端 (如右下角的终点) 时, 'backward' 收敛最快。
+    """
+    tables, R = _scalar_backup_tables(mdp)
+    S = mdp.num_states
+    V = [0.0] * S
+    forward, backward = range(S), range(S - 1, -1, -1)
+    iteration = 0
+    while iteration < max_iterations:
+        if order == 'forward':
+            states = forward
+        elif order == 'backward':
+            states = backward
+        else:
+            states = forward if iteration % 2 == 0 else backward
+        delta = 0.0
+        for s in states:
+            v = _backup(s, V, tables, R, mdp.gamma)
+            diff = abs(v - V[s])
+            if diff > delta:
+                delta = diff
+            V[s] = v
+        iteration += 1
+        if delta < theta:
+            break
+    return ValueIterationResult(np.array(V), iteration, iteration * S)
+
+def predecessor_matrix(mdp: SparseMDP) -> sp.csr_matrix:
+    """前驱矩阵: 第 s' 行的非零列即 pred[s'] = {s | ∃a, P(s'|s,a) > 0}"""
+    reach = sum(abs(P_a) for P_a in mdp.P)
+    return sp.csr_matrix(reach.T)
+
+def predecessor_lists(mdp: SparseMDP) -> Tuple[List[int], List[int]]:
+    """
+    前驱表 (CSR 形式): pred[s'] = {s | ∃a, P(s'|s,a) > 0}。
+    返回 (indptr, indices), s' 的前驱为 indices[indptr[s']:indptr[s'+1]]。
+    """
+    pred = predecessor_matrix(mdp)
+    return pred.indptr.tolist(), pred.indices.tolist()
+
+def prioritized_sweeping(
+    mdp: SparseMDP,
+    theta: float = 1e-4,
+    max_backups: Optional[int] = None
+) -> ValueIterationResult:
+    """
+    优先级扫描 (Prioritized Sweeping, Moore & Atkeson 1993 的规划版本)。
+
+    用最大堆按贝尔曼残差 |T V(s) - V(s)| 排序, 每次只更新残差最大的状态;
+    某状态的价值改变后, 只需重新计算其前驱的残差。稀疏奖励的大网格上
+    绝大多数状态只被更新一两次, 总回溯数远少于同步扫描。
+
+    结束时所有状态的贝尔曼残差都不超过 theta。
+    """
+    tables, R = _scalar_backup_tables(mdp)
+    pred_ptr, pred_idx = predecessor_lists(mdp)
+    gamma = mdp.gamma
+    S = mdp.num_states
+    V = [0.0] * S
+    priority = [0.0] * S
+    heap: List[Tuple[float, int]] = []
+
+    # 初始化: 计算所有状态的残差
+    for s in range(S):
+        residual = abs(_backup(s, V, tables, R, gamma))
+        if residual > theta:
+            priority[s] = residual
+            heap.append((-residual, s))
+    heapq.heapify(heap)
+    backups, updates = S, 0
+
+    while heap and (max_backups is None or backups < max_backups):
+        neg_priority, s = heapq.heappop(heap)
+        if -neg_priority != priority[s]:
+            continue  # 过期条目 (该状态已以更高优先级入堆或已被更新)
+        V[s] = _backup(s, V, tables, R, gamma)
+        priority[s] = 0.0
+        backups += 1
+        updates += 1
+
+        for k in range(pred_ptr[s], pred_ptr[s + 1]):
+            p = pred_idx[k]
+            residual = abs(_backup(p, V, tables, R, gamma) - V[p])
+            backups += 1
+            if residual > theta and residual > priority[p]:
+                priority[p] = residual
+                heapq.heappush(heap, (-residual, p))
+
+    return ValueIterationResult(np.array(V), updates, backups)
+
+# ============================================
+# 策略迭代: 用线性方程组求解代替数千轮扫描
+# ============================================
+
+def greedy_policy(mdp: SparseMDP, V: np.ndarray, previous: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    π(s) = argmax_a Q(s, a)。
+    给定 previous 时, 只有严格更优 (超过 1e-12) 的动作才替换旧动作, 避免并列动作导致策略来回振荡。
+    """
+    Q = mdp.q_values(V)
+    policy = Q.argmax(axis=0)
+    if previous is not None:
+        states = np.arange(mdp.num_states)
+        keep = Q[previous, states] >= Q[policy, states] - 1e-12
+        policy[keep] = previous[keep]
+    return policy
+
+def policy_matrices(mdp: SparseMDP, policy: np.ndarray) -> Tuple[sp.csr_matrix, np.ndarray]:
+    """
+    固定策略下的马尔可夫链:
+        P_π[s, :] = P[π(s)][s, :],   R_π[s] = R[π(s), s]
+    """
+    P_pi = sum(sp.diags((policy == a).astype(np.float64)) @ mdp.P[a] for a in range(mdp.num_actions))
+    R_pi = mdp.R[policy, np.arange(mdp.num_states)]
+    return sp.csr_matrix(P_pi), R_pi
+
+def evaluate_policy(
+    mdp: SparseMDP,
+    policy: np.ndarray,
+    method: str = 'direct',
+    V0: Optional[np.ndarray] = None,
+    tol: float = 1e-10
+) -> np.ndarray:
+    """
+    精确策略评估: 求解贝尔曼期望方程的线性形式
+        (I - γ P_π) V = R_π
+
+    Args:
+        method: 'direct' 稀疏 LU 直接求解 (spsolve);
+                'gmres' / 'bicgstab' ILU 预条件的 Krylov 迭代法, 可用上一轮的 V 作为初值热启动。
+                (I - γ P_π) 不对称, 所以不能直接用只适用于对称正定矩阵的共轭梯度法。
+    """
+    P_pi, R_pi = policy_matrices(mdp, policy)
+    A = sp.identity(mdp.num_states, format='csr') - mdp.gamma * P_pi
+    if method == 'direct':
+        return spla.spsolve(A.tocsc(), R_pi)
+    solvers = {'gmres': spla.gmres, 'bicgstab': spla.bicgstab}
+    if method not in solvers:
+        raise ValueError(f"Unknown evaluation method '{method}'")
+    # γ → 1 时 (I - γ P_π) 接近奇异, 不加预条件的 Krylov 法收敛极慢; 用不完全 LU 作预条件,
+    # 个别策略下 ILU 会遇到零主元, 此时退回无预条件版本
+    try:
+        M = spla.LinearOperator(A.shape, spla.spilu(A.tocsc()).solve)
+    except RuntimeError:
+        M = None
+    V, info = solvers[method](A, R_pi, x0=V0, rtol=tol, atol=0.0, M=M)
+    if info > 0:
+        print(f"Warning: {method} did not converge within {info} iterations")
+    return V
+
+def policy_iteration(
+    mdp: SparseMDP,
+    evaluation: str = 'direct',
+    max_iterations: int = 1000
+) -> ValueIterationResult:
+    """
+    策略迭代 (Howard 1960): 交替进行
+      1. 策略评估: 解 (I - γ P_π) V = R_π
+      2. 策略改进: π ← greedy(V)
+    直到策略不再改变。改进步数通常只有个位数到几十, 且基本与 γ 无关,
+    而价值迭代需要 O(log(1/θ) / (1 - γ)) 轮扫描, γ → 1 时代价爆炸。
+    """
+    S = mdp.num_states
+    policy = np.zeros(S, dtype=np.int64)
+    V = None
+    iteration = 0
+    while iteration < max_iterations:
+        V = evaluate_policy(mdp, policy, evaluation, V0=V)
+        new_policy = greedy_policy(mdp, V, previous=policy)
+        iteration += 1
+        if np.array_equal(new_policy, policy):
+            break
+        policy = new_policy
+    return ValueIterationResult(V, iteration, iteration * S, policy)
+
+def modified_policy_iteration(
+    mdp: SparseMDP,
+    k: int = 20,
+    theta: float = 1e-4,
+    max_iterations: int = 100000
+) -> ValueIterationResult:
+    """
+    修正策略迭代 (Puterman & Shin 1978): 策略评估只做 k 轮截断的期望回溯
+        V ← R_π + γ P_π V
+    k = 0 即价值迭代, k → ∞ 即策略迭代。当贝尔曼残差 ||T V - V||_∞ < theta 时停止。
+    """
+    S = mdp.num_states
+    V = np.zeros(S)
+    policy = None
+    iteration, backups = 0, 0
+    while iteration < max_iterations:
+        Q = mdp.q_values(V)
+        policy = Q.argmax(axis=0)
+        new_V = Q[policy, np.arange(S)]
+        backups += S
+        iteration += 1
+        if np.abs(new_V - V).max() < theta:
+            V = new_V
+            break
+        P_pi, R_pi = policy_matrices(mdp, policy)
+        V = new_V
+        for _ in range(k):
+            V = R_pi + mdp.gamma * (P_pi @ V)
+        backups += k * S
+    return ValueIterationResult(V, iteration, backups, policy)
+
+# ============================================
+# 增量求解: 环境被编辑后热启动, 只从受影响的状态向外传播
+# ============================================
+
+def changed_states(old: SparseMDP, new: SparseMDP) -> np.ndarray:
+    """两个同规模 MDP 之间转移概率或期望奖励发生变化的状态编号"""
+    changed = np.any(old.R != new.R, axis=0)
+    for P_old, P_new in zip(old.P, new.P):
+        diff = sp.csr_matrix(abs(P_old - P_new))
+        diff.eliminate_zeros()
+        changed |= np.diff(diff.indptr) > 0
+    return np.flatnonzero(changed)
+
+class IncrementalSolver:
+    """
+    热启动的增量价值迭代。
+
+    编辑 (移动终点/陷阱、修改奖励) 通常只改变少数状态的转移或奖励。
+    以旧的 V 为初值, 先回溯这些状态; 凡是价值变化超过 theta 的状态,
+    把它的前驱加入下一轮的活跃集合, 如此向外逐层传播, 直到活跃集合为空。
+    每一轮是对活跃行的一次向量化稀疏回溯, 工作量只与受影响区域成正比。
+
+    前驱表只增不减: 编辑后新增的边以补丁形式追加,
+    旧边即使已不存在也只会带来无害的额外检查。
+    """
+    def __init__(
+        self,
+        mdp: SparseMDP,
+        theta: float = 1e-4,
+        initial: Optional[ValueIterationResult] = None
+    ):
+        self.theta = theta
+        self._set_model(mdp)
+        self._pred = [predecessor_matrix(mdp)]
+        if initial is None:
+            initial = sparse_value_iteration(mdp, theta)
+        self.V = initial.V.copy()
+        self.policy = initial.policy.copy() if initial.policy is not None else greedy_policy(mdp, self.V)
+
+    def _set_model(self, mdp: SparseMDP) -> None:
+        # 各动作的 P 纵向拼成 [A*S, S], 每轮只需一次行切片
+        self.mdp = mdp
+        self._P_stacked = sp.csr_matrix(sp.vstack(mdp.P))
+        self._R_flat = mdp.R.reshape(-1)
+
+    def _predecessors(self, states: np.ndarray) -> np.ndarray:
+        return np.unique(np.concatenate([pred[states].indices for pred in self._pred]))
+
+    def _q_rows(self, states: np.ndarray) -> np.ndarray:
+        """只对给定状态计算 Q[a, s] (CSR 行切片)"""
+        S, A = self.mdp.num_states, self.mdp.num_actions
+        rows = (np.arange(A)[:, None] * S + states[None, :]).reshape(-1)
+        Q = self._R_flat[rows] + self.mdp.gamma * (self._P_stacked[rows] @ self.V)
+        return Q.reshape(A, states.size)
+
+    def resolve(self, new_mdp: SparseMDP, changed: Optional[np.ndarray] = None) -> ValueIterationResult:
+        """
+        切换到编辑后的 new_mdp 并增量更新 V 与策略。
+
+        Args:
+            new_mdp: 编辑后的 MDP (状态空间与动作空间不变)
+            changed: 已知被修改的状态; 缺省时与旧模型逐行比较得到
+
+        Returns:
+            ValueIterationResult, iterations 为传播轮数, backups 为回溯的状态数
+        """
+        if changed is None:
+            changed = changed_states(self.mdp, new_mdp)
+        changed = np.asarray(changed, dtype=np.int64)
+        S = new_mdp.num_states
+
+        # 被修改行在新模型中的出边可能是新的前驱关系, 以补丁形式加入前驱表
+        reach = sp.coo_matrix(sum(abs(P_a[changed]) for P_a in new_mdp.P))
+        self._pred.append(sp.csr_matrix(
+            (np.ones(reach.nnz), (reach.col, changed[reach.row])), shape=(S, S)
+        ))
+        if len(self._pred) > 8:
+            self._pred = [sp.csr_matrix(sum(self._pred))]
+        self._set_model(new_mdp)
+
+        active, dirty = changed, [changed]
+        rounds, backups = 0, 0
+        while active.size > 0:
+            new_values = self._q_rows(active).max(axis=0)
+            moved = active[np.abs(new_values - self.V[active]) > self.theta]
+            self.V[active] = new_values
+            rounds += 1
+            backups += active.size
+            active = self._predecessors(moved) if moved.size > 0 else moved
+            dirty.append(active)
+
+        # 只有价值被改写的状态及其前驱的贪心动作可能改变
+        dirty = np.unique(np.concatenate(dirty))
+        candidates = np.union1d(dirty, self._predecessors(dirty)) if dirty.size > 0 else dirty
+        if candidates.size > 0:
+            Q = self._q_rows(candidates)
+            best = Q.argmax(axis=0)
+            old = self.policy[candidates]
+            keep = Q[old, np.arange(candidates.size)] >= Q[best, np.arange(candidates.size)] - 1e-12
+            self.policy[candidates] = np.where(keep, old, best)
+
+        return ValueIterationResult(self.V.copy(), rounds, backups, self.policy.copy())
+
+# ============================================
+# 外存价值迭代: V 与转移表放在 np.memmap 文件中
+# ============================================
+
+class OutOfCoreValueIteration:
+    """
+    磁盘驻留的价值迭代, 面向 V 和转移表放不进内存的大网格 (1e8+ 状态)。
+
+    directory 下的文件:
+        next_state.i32 [S, A]  后继状态编号 (int32 足够 2^31 个状态)
+        reward.f32     [S, A]  即时奖励
+        V0.f32, V1.f32 [S]     双缓冲: 一轮扫描只读旧 V, 只写新 V
+        checkpoint.json        已完成的轮数、当前轮内的下一块、当前轮的最大残差
+
+    每次处理 block_rows 行网格: 读入该块的转移表, 以及它能到达的 V 窗口
+    (上下各多一行的 halo), 在内存中完成回溯后顺序写回。所有文件都按顺序访问,
+    常驻内存只与块大小有关。每处理 checkpoint_every 块, 先把新 V 刷到磁盘,
+    再原子地替换 checkpoint.json; 进程在任意时刻被中断,
+    重新构造同一目录的对象后 solve() 会从最后一个检查点所在的块继续。
+    """
+    def __init__(
+        self,
+        env: SimpleGridWorld,
+        directory: str,
+        block_rows: int = 256,
+        checkpoint_every: int = 16
+    ):
+        self.env = env
+        self.directory = directory
+        self.block_rows = block_rows
+        self.checkpoint_every = checkpoint_every
+        self.num_blocks = -(-env.rows // block_rows)
+        os.makedirs(directory, exist_ok=True)
+
+        self._meta = {
+            "rows": env.rows, "cols": env.cols, "gamma": env.gamma,
+            "goal_state": list(env.goal_state),
+            "trap_state": list(env.trap_state) if env.trap_state is not None else None,
+            "goal_reward": env.goal_reward, "trap_reward": env.trap_reward,
+            "block_rows": block_rows,
+        }
+        self.state = self._load_checkpoint()
+        if self.state is None:
+            self._build_tables()
+            self.state = {"meta": self._meta, "iteration": 0, "block": 0, "delta": 0.0, "converged": False}
+            self._save_checkpoint()
+
+        S, A = env.num_states, len(env.actions)
+        self.next_state = np.memmap(self._path("next_state.i32"), dtype=np.int32, mode="r", shape=(S, A))
+        self.reward = np.memmap(self._path("reward.f32"), dtype=np.float32, mode="r", shape=(S, A))
+        self.buffers = [np.memmap(self._path(f"V{i}.f32"), dtype=np.float32, mode="r+", shape=(S,))
+                        for i in range(2)]
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load_checkpoint(self) -> Optional[Dict]:
+        path = self._path("checkpoint.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            state = json.load(f)
+        if state["meta"] != self._meta:
+            raise ValueError(f"{self.directory} 中的检查点属于另一个问题: {state['meta']}")
+        return state
+
+    def _save_checkpoint(self) -> None:
+        # 先写临时文件再 os.replace, 中断时检查点要么是旧的要么是新的, 不会是半个
+        tmp = self._path("checkpoint.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self._path("checkpoint.json"))
+
+    def _build_tables(self) -> None:
+        """逐块编译转移表写入 memmap, 并把两个 V 缓冲初始化为 0"""
+        env = self.env
+        S, A = env.num_states, len(env.actions)
+        next_state = np.memmap(self._path("next_state.i32"), dtype=np.int32, mode="w+", shape=(S, A))
+        reward = np.memmap(self._path("reward.f32"), dtype=np.float32, mode="w+", shape=(S, A))
+        for row_start in range(0, env.rows, self.block_rows):
+            row_end = min(row_start + self.block_rows, env.rows)
+            ns, rw = env.compile_rows(row_start, row_end)
+            next_state[row_start * env.cols:row_end * env.cols] = ns
+            reward[row_start * env.cols:row_end * env.cols] = rw
+        next_state.flush()
+        reward.flush()
+        del next_state, reward
+        for i in range(2):
+            V = np.memmap(self._path(f"V{i}.f32"), dtype=np.float32, mode="w+", shape=(S,))
+            V.flush()
+            del V
+
+    @property
+    def V(self) -> np.memmap:
+        """最近一轮完整扫描的结果 (中途被打断时为上一轮的值)"""
+        return self.buffers[self.state["iteration"] % 2]
+
+    @property
+    def nbytes(self) -> int:
+        return self.next_state.nbytes + self.reward.nbytes + 2 * self.buffers[0].nbytes
+
+    def _sweep_block(self, b: int, V_old: np.ndarray, V_new: np.ndarray) -> float:
+        cols, gamma = self.env.cols, self.env.gamma
+        row_start = b * self.block_rows
+        row_end = min(row_start + self.block_rows, self.env.rows)
+        lo, hi = row_start * cols, row_end * cols
+        # 确定性网格中后继最多相差一行: 只需读入带 halo 的 V 窗口
+        win_lo, win_hi = max(row_start - 1, 0) * cols, min(row_end + 1, self.env.rows) * cols
+        window = np.asarray(V_old[win_lo:win_hi])
+        ns = np.asarray(self.next_state[lo:hi]) - win_lo
+        new_values = (np.asarray(self.reward[lo:hi]) + gamma * window[ns]).max(axis=1)
+        delta = float(np.abs(new_values - window[lo - win_lo:hi - win_lo]).max())
+        V_new[lo:hi] = new_values
+        return delta
+
+    def solve(
+        self,
+        theta: float = 1e-4,
+        max_iterations: int = 100000,
+        max_blocks: Optional[int] = None
+    ) -> ValueIterationResult:
+        """
+        从检查点继续扫描直到残差 < theta。
+
+        Args:
+            max_blocks: 本次调用最多处理的块数, 用完即保存检查点并返回 (模拟中断)
+
+        Returns:
+            ValueIterationResult, V 为磁盘上的 memmap; 是否收敛见 self.converged
+        """
+        state = self.state
+        processed = 0
+        while not state["converged"] and state["iteration"] < max_iterations:
+            V_old = self.buffers[state["iteration"] % 2]
+            V_new = self.buffers[(state["iteration"] + 1) % 2]
+            while state["block"] < self.num_blocks:
+                if max_blocks is not None and processed >= max_blocks:
+                    V_new.flush()
+                    self._save_checkpoint()
+                    return self._result()
+                state["delta"] = max(state["delta"], self._sweep_block(state["block"], V_old, V_new))
+                state["block"] += 1
+                processed += 1
+                if state["block"] % self.checkpoint_every == 0:
+                    V_new.flush()
+                    self._save_checkpoint()
+            V_new.flush()
+            state["iteration"] += 1
+            state["converged"] = state["delta"] < theta
+            state["block"], state["delta"] = 0, 0.0
+            self._save_checkpoint()
+        return self._result()
+
+    @property
+    def converged(self) -> bool:
+        return self.state["converged"]
+
+    def _result(self) -> ValueIterationResult:
+        done = self.state["iteration"] * self.env.num_states + self.state["block"] * self.block_rows * self.env.cols
+        return ValueIterationResult(self.V, self.state["iteration"], done)
+
+# ============================================
+# 多核分块价值迭代: V 放在共享内存, 块之间只交换 halo 行
+# ============================================
+
+def _tile_sweeps(
+    env: SimpleGridWorld,
+    buf,
+    row_start: int,
+    row_end: int,
+    worker: int,
+    num_workers: int,
+    barrier,
+    theta: float,
+    max_iterations: int
+) -> None:
+    """单个 worker 的扫描循环; buf 为共享内存, 布局见 tiled_parallel_value_iteration"""
+    S, cols = env.num_states, env.cols
+    buffers = np.ndarray((2, S), dtype=np.float64, buffer=buf)
+    residual = np.ndarray((2, num_workers), dtype=np.float64, buffer=buf, offset=2 * S * 8)
+    iterations = np.ndarray((num_workers,), dtype=np.int64, buffer=buf, offset=(2 * S + 2 * num_workers) * 8)
+
+    # 本块的转移表只在本进程内编译和使用, 后继编号改写为相对 halo 窗口的偏移
+    lo, hi = row_start * cols, row_end * cols
+    win_lo, win_hi = max(row_start - 1, 0) * cols, min(row_end + 1, env.rows) * cols
+    next_state, reward = env.compile_rows(row_start, row_end)
+    next_state = np.ascontiguousarray((next_state - win_lo).T)
+    reward = np.ascontiguousarray(reward.T)
+
+    iteration = 0
+    while iteration < max_iterations:
+        V_old, V_new = buffers[iteration % 2], buffers[(iteration + 1) % 2]
+        # 读本块 + 上下各一行 halo (邻块在上一轮写入的边界), 只写本块
+        window = V_old[win_lo:win_hi]
+        new_values = (reward + env.gamma * window[next_state]).max(axis=0)
+        residual[iteration % 2, worker] = np.abs(new_values - window[lo - win_lo:hi - win_lo]).max()
+        V_new[lo:hi] = new_values
+        iteration += 1
+        # 一次屏障同时完成 halo 交换与残差归约: 所有 worker 读到同一组残差, 做出同一个决定。
+        # 残差按轮次双缓冲, 下一轮写入的槽位不会被仍在读取本轮结果的 worker 看到
+        barrier.wait()
+        if residual[(iteration - 1) % 2].max() < theta:
+            break
+    iterations[worker] = iteration
+
+def _tile_worker(env: SimpleGridWorld, shm_name: str, *args) -> None:
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        _tile_sweeps(env, shm.buf, *args)
+    finally:
+        shm.close()
+
+def tiled_parallel_value_iteration(
+    env: SimpleGridWorld,
+    num_workers: int = 4,
+    theta: float = 1e-4,
+    max_iterations: int = 100000
+) -> ValueIterationResult:
+    """
+    多进程分块的同步价值迭代 (迭代序列与 vectorized_value_iteration 逐项一致)。
+
+    网格按行切成 num_workers 个连续的块, 每个常驻进程负责一块。
+    共享内存布局 (float64/int64):
+        [2, S]            双缓冲的 V: 第 k 轮读 V[k % 2], 写 V[(k+1) % 2]
+        [2, num_workers]  每块的最大残差 (按轮次双缓冲)
+        [num_workers]     每个 worker 完成的轮数
+    每轮每个 worker 只读自己的块和相邻块的一行边界, 然后在屏障处同步;
+    屏障之后每个 worker 都对残差做全局 max, 无需主进程参与。
+    """
+    S = env.num_states
+    num_workers = max(1, min(num_workers, env.rows))
+    shm = shared_memory.SharedMemory(create=True, size=(2 * S + 3 * num_workers) * 8)
+    try:
+        shared = np.ndarray((2 * S + 3 * num_workers,), dtype=np.float64, buffer=shm.buf)
+        shared[:] = 0.0
+        del shared
+
+        bounds = np.linspace(0, env.rows, num_workers + 1).astype(int)
+        ctx = mp.get_context()
+        barrier = ctx.Barrier(num_workers)
+        workers = [
+            ctx.Process(target=_tile_worker, args=(env, shm.name, int(bounds[w]), int(bounds[w + 1]),
+                                                   w, num_workers, barrier, theta, max_iterations))
+            for w in range(num_workers)
+        ]
+        for p in workers:
+            p.start()
+        # 某个 worker 异常退出时中止屏障, 否则其余 worker 会永远等待
+        while any(p.is_alive() for p in workers):
+            if any(p.exitcode not in (None, 0) for p in workers):
+                barrier.abort()
+            for p in workers:
+                p.join(timeout=0.05)
+        failed = [w for w, p in enumerate(workers) if p.exitcode != 0]
+        if failed:
+            raise RuntimeError(f"分块价值迭代的 worker {failed} 异常退出")
+
+        iterations = int(np.ndarray((num_workers,), dtype=np.int64, buffer=shm.buf,
+                                    offset=(2 * S + 2 * num_workers) * 8)[0])
+        V = np.ndarray((2, S), dtype=np.float64, buffer=shm.buf)[iterations % 2].copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return ValueIterationResult(V, iterations, iterations * S)
+
+def value_iteration(env: Union[SimpleGridWorld, SparseMDP], theta: float = 1e-4, method: str = 'dict'):
     """
     求解最优价值函数 V*
+
+    Args:
+        env: 网格世界, 或任意 SparseMDP (此时返回按状态编号排列的 np.ndarray)
+        theta: 收敛阈值
+        method: 'dict' 逐状态 Python 循环; 'vectorized' 先编译为张量再整体迭代;
+                对 SparseMDP, 'dict' / 'vectorized' / 'sparse' 均为同步稀疏迭代,
+                另可选 'gauss_seidel' 与 'prioritized'
     """
+    if isinstance(env, SparseMDP):
+        if method == 'gauss_seidel':
+            result = gauss_seidel_value_iteration(env, theta)
+        elif method == 'prioritized':
+            result = prioritized_sweeping(env, theta)
+        elif method in ('dict', 'vectorized', 'sparse'):
+            result = sparse_value_iteration(env, theta)
+        else:
+            raise ValueError(f"Unknown method '{method}'")
+        print(f"Converged after {result.iterations} iterations.")
+        return result.V
+    if method == 'vectorized':
+        result = vectorized_value_iteration(env.compile(), theta)
+        print(f"Converged after {result.iterations} iterations.")
+        return {s: float(v) for s, v in zip(env.states, result.V)}
+    if method != 'dict':
+        raise ValueError(f"Unknown method '{method}'")
+
     # 初始化 V(s) = 0
     V = {s: 0.0 for s in env.states}
     
@@ -102,17 +945,28 @@ def value_iteration(env: SimpleGridWorld, theta: float = 1e-4):
 # 第三部分: 可视化与验证
 # ============================================
 
-def visualize_values(env: SimpleGridWorld, V: Dict):
-    """打印网格价值"""
-    print("\nState Values:")
-    grid = np.zeros((env.rows, env.cols))
-    for r in range(env.rows):
-        row_str = ""
-        for c in range(env.cols):
-            val = V[(r, c)]
-            grid[r, c] = val
-            row_str += f"{val:6.3f} "
-        print(row_str)
+def visualize_values(env: Union[SimpleGridWorld, SparseMDP], V: Union[Dict, np.ndarray], max_print: int = 400,
+                     save_path: str = 'value_iteration_grid.png'):
+    """
+    打印网格价值 (V 可以是 {(r, c): v} 字典或按状态编号排列的数组)
+    没有网格形状的 SparseMDP (shape=None) 只打印前 max_print 个状态的价值, 不画图
+    """
+    if isinstance(env, SparseMDP) and env.shape is None:
+        values = np.asarray(V, dtype=np.float64)
+        print(f"\nState Values (前 {min(max_print, len(values))} / {len(values)} 个状态):")
+        print(" ".join(f"{val:6.3f}" for val in values[:max_print]))
+        return
+    rows, cols = (env.rows, env.cols) if isinstance(env, SimpleGridWorld) else env.shape
+    if isinstance(V, dict):
+        grid = np.array([[V[(r, c)] for c in range(cols)] for r in range(rows)])
+    else:
+        grid = np.asarray(V, dtype=np.float64).reshape(rows, cols)
+
+    # 大网格只画热力图, 不逐格打印
+    if rows * cols <= max_print:
+        print("\nState Values:")
+        for r in range(rows):
+            print("".join(f"{val:6.3f} " for val in grid[r]))
     
     # 简单的 Matplotlib 热力图
     try:
@@ -122,16 +976,265 @@ def visualize_values(env: SimpleGridWorld, V: Dict):
         plt.title('Value Iteration Result')
         
         # 标注数值
-        for i in range(env.rows):
-            for j in range(env.cols):
+        for i in range(rows if rows * cols <= max_print else 0):
+            for j in range(cols):
                 plt.text(j, i, f'{grid[i, j]:.2f}', ha='center', va='center', color='white')
                 
-        plt.savefig('value_iteration_grid.png')
-        print(">>> 结果图已保存为 value_iteration_grid.png")
+        plt.savefig(save_path)
+        plt.close()
+        print(f">>> 结果图已保存为 {save_path}")
     except Exception as e:
         print(f"Plotting failed: {e}")
 
+# ============================================
+# 第四部分: 基准测试
+# ============================================
+
+def benchmark_value_iteration(
+    sizes: Tuple[int, ...] = (10, 100, 1000),
+    dict_max_size: int = 100,
+    theta: float = 1e-4
+) -> List[Dict]:
+    """
+    字典版 vs 张量版价值迭代。
+
+    字典版每轮对每个 (s, a) 调用一次 get_transition, 在 1000x1000 网格上
+    需要数小时, 因此只在 size <= dict_max_size 时运行并校验两者一致。
+    """
+    rows = []
+    print(f"\n{'grid':>11} | {'states':>10} | {'iters':>6} | {'compile':>8} | {'vectorized':>10} | {'dict':>8} | {'max |ΔV|':>9}")
+    print("-" * 80)
+    for n in sizes:
+        env = SimpleGridWorld(rows=n, cols=n)
+        start = time.perf_counter()
+        model = env.compile()
+        compile_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = vectorized_value_iteration(model, theta)
+        vec_time = time.perf_counter() - start
+
+        dict_time, max_diff = float('nan'), float('nan')
+        if n <= dict_max_size:
+            start = time.perf_counter()
+            V_dict = value_iteration(env, theta)
+            dict_time = time.perf_counter() - start
+            max_diff = max(abs(V_dict[s] - result.V[env.state_to_index(s)]) for s in env.states)
+
+        rows.append({
+            "size": n, "iterations": result.iterations, "compile_s": compile_time,
+            "vectorized_s": vec_time, "dict_s": dict_time, "max_abs_diff": max_diff
+        })
+        dict_col = f"{dict_time:>7.3f}s | {max_diff:>9.2e}" if n <= dict_max_size else f"{'skip':>8} | {'-':>9}"
+        print(f"{n:>4} x {n:<4} | {env.num_states:>10,} | {result.iterations:>6} | {compile_time:>7.3f}s | "
+              f"{vec_time:>9.3f}s | {dict_col}")
+    return rows
+
+def benchmark_backups(size: int = 100, slip_prob: float = 0.0, theta: float = 1e-4) -> List[Dict]:
+    """
+    同步 / Gauss-Seidel / 优先级扫描的总回溯次数对比 (稀疏奖励大网格)。
+    ΔV 为与同步价值迭代结果的最大差异。
+    """
+    env = SimpleGridWorld(rows=size, cols=size)
+    mdp = SparseMDP.from_grid_world(env, slip_prob)
+    solvers = [
+        ('synchronous', lambda: sparse_value_iteration(mdp, theta)),
+        ('gauss_seidel_fwd', lambda: gauss_seidel_value_iteration(mdp, theta, order='forward')),
+        ('gauss_seidel_bwd', lambda: gauss_seidel_value_iteration(mdp, theta, order='backward')),
+        ('prioritized', lambda: prioritized_sweeping(mdp, theta)),
+    ]
+    rows = []
+    print(f"\n{size}x{size} 网格, slip={slip_prob}: 回溯次数对比")
+    print(f"{'solver':>18} | {'iterations':>10} | {'backups':>10} | {'vs sync':>8} | {'seconds':>8} | {'max |ΔV|':>9}")
+    print("-" * 80)
+    reference = None
+    for name, solve in solvers:
+        start = time.perf_counter()
+        result = solve()
+        elapsed = time.perf_counter() - start
+        reference = reference or result
+        diff = float(np.abs(result.V - reference.V).max())
+        rows.append({"solver": name, "iterations": result.iterations, "backups": result.backups,
+                     "seconds": elapsed, "max_abs_diff": diff})
+        print(f"{name:>18} | {result.iterations:>10,} | {result.backups:>10,} | "
+              f"{result.backups / reference.backups:>7.2%} | {elapsed:>7.3f}s | {diff:>9.2e}")
+    return rows
+
+def _restart_rows(P: List[sp.csr_matrix], states: List[int], start: int) -> List[sp.csr_matrix]:
+    """把给定状态的出边改为确定性地回到 start (吸收态 -> 持续性任务)"""
+    S = P[0].shape[0]
+    keep = np.ones(S)
+    keep[states] = 0.0
+    jump = sp.csr_matrix((np.ones(len(states)), (states, np.full(len(states), start))), shape=(S, S))
+    return [sp.csr_matrix(sp.diags(keep) @ P_a + jump) for P_a in P]
+
+def benchmark_policy_iteration(
+    size: int = 50,
+    slip_prob: float = 0.2,
+    gammas: Tuple[float, ...] = (0.9, 0.99, 0.999),
+    theta: float = 1e-6
+) -> List[Dict]:
+    """
+    不同 γ 下各求解器的墙钟时间。
+    ΔV 为与稀疏直接法策略迭代 (精确解) 的最大差异。
+
+    终点与陷阱若是吸收态, 回报会被很快截断, 价值迭代的轮数几乎与 γ 无关;
+    为了体现 γ → 1 的困难, 这里把它们改为 "回到起点 (0, 0)" 的持续性任务,
+    此时 V 的量级为 1 / (1 - γ), 价值迭代需要 O(log(1/θ) / (1 - γ)) 轮扫描。
+    """
+    env = SimpleGridWorld(rows=size, cols=size)
+    rows = []
+    print(f"\n{size}x{size} 持续性网格, slip={slip_prob}: 墙钟时间 vs γ")
+    print(f"{'gamma':>6} | {'solver':>14} | {'iterations':>10} | {'seconds':>8} | {'max |ΔV|':>9}")
+    print("-" * 62)
+    for gamma in gammas:
+        env.gamma = gamma
+        episodic = SparseMDP.from_grid_world(env, slip_prob)
+        restart = [env.state_to_index(env.goal_state), env.state_to_index(env.trap_state)]
+        mdp = SparseMDP(_restart_rows(episodic.P, restart, start=0), episodic.R, gamma, episodic.shape)
+        solvers = [
+            ('pi_direct', lambda: policy_iteration(mdp, 'direct')),
+            ('pi_gmres', lambda: policy_iteration(mdp, 'gmres')),
+            ('mpi_k20', lambda: modified_policy_iteration(mdp, k=20, theta=theta)),
+            ('value_iter', lambda: sparse_value_iteration(mdp, theta, max_iterations=10**6)),
+        ]
+        exact = None
+        for name, solve in solvers:
+            start = time.perf_counter()
+            result = solve()
+            elapsed = time.perf_counter() - start
+            exact = exact if exact is not None else result.V
+            diff = float(np.abs(result.V - exact).max())
+            rows.append({"gamma": gamma, "solver": name, "iterations": result.iterations,
+                         "seconds": elapsed, "max_abs_diff": diff})
+            print(f"{gamma:>6} | {name:>14} | {result.iterations:>10,} | {elapsed:>7.3f}s | {diff:>9.2e}")
+    return rows
+
+def benchmark_incremental(size: int = 500, theta: float = 1e-4) -> List[Dict]:
+    """
+    交互式 what-if: 依次对网格做几处编辑, 比较从 V = 0 完整重解与增量热启动重解。
+    build 为重建 SparseMDP 的时间, diff 为逐行比较找出被修改状态的时间 (两种方式都需要 build)。
+    两种解都只精确到 theta·γ/(1-γ) 量级, max |ΔV| 应落在这一范围内。
+    """
+    env = SimpleGridWorld(rows=size, cols=size)
+    mdp = SparseMDP.from_grid_world(env)
+    solver = IncrementalSolver(mdp, theta)
+
+    edits = [
+        ("move goal to center", dict(goal_state=(size // 2, size // 2))),
+        ("move trap next to goal", dict(trap_state=(size // 2, size // 2 - 1))),
+        ("goal reward 1 -> 5", dict(goal_reward=5.0)),
+    ]
+    rows = []
+    print(f"\n{size}x{size} 网格增量重解 ({env.num_states:,} 个状态)")
+    print(f"{'edit':>24} | {'build':>7} | {'diff':>7} | {'full':>8} | {'incremental':>11} | {'backups':>9} | {'max |ΔV|':>9}")
+    print("-" * 96)
+    for name, change in edits:
+        for attr, value in change.items():
+            setattr(env, attr, value)
+        start = time.perf_counter()
+        new_mdp = SparseMDP.from_grid_world(env)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        full = sparse_value_iteration(new_mdp, theta)
+        full_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        changed = changed_states(solver.mdp, new_mdp)
+        diff_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = solver.resolve(new_mdp, changed)
+        inc_time = time.perf_counter() - start
+
+        max_diff = float(np.abs(result.V - full.V).max())
+        rows.append({"edit": name, "build_s": build_time, "diff_s": diff_time, "full_s": full_time,
+                     "incremental_s": inc_time, "backups": result.backups, "max_abs_diff": max_diff})
+        print(f"{name:>24} | {build_time:>6.3f}s | {diff_time:>6.3f}s | {full_time:>7.3f}s | "
+              f"{inc_time * 1e3:>9.1f}ms | {result.backups:>9,} | {max_diff:>9.2e}")
+    return rows
+
+def benchmark_out_of_core(rows: int = 1000, cols: int = 1000, block_rows: int = 128,
+                          theta: float = 1e-4) -> Dict:
+    """
+    外存价值迭代: 先求解到一半时人为中断, 再用新对象从检查点续算,
+    最后与内存中的张量化价值迭代对比 (float32 与 float64 的差应在 1e-5 量级)。
+    """
+    env = SimpleGridWorld(rows=rows, cols=cols)
+    print(f"\n{rows}x{cols} 网格外存价值迭代 ({env.num_states:,} 个状态, 每块 {block_rows} 行)")
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        solver = OutOfCoreValueIteration(env, directory, block_rows)
+        build_time = time.perf_counter() - start
+        block_mb = block_rows * cols * (8 + 16 + 16) / 2**20
+        print(f"  磁盘文件 {solver.nbytes / 2**20:.0f} MB, 每块工作集约 {block_mb:.1f} MB, 建表 {build_time:.2f}s")
+
+        start = time.perf_counter()
+        partial = solver.solve(theta, max_blocks=solver.num_blocks * 20 + solver.num_blocks // 2)
+        first_time = time.perf_counter() - start
+        print(f"  中断于第 {partial.iterations} 轮第 {solver.state['block']} 块, 用时 {first_time:.2f}s")
+
+        start = time.perf_counter()
+        resumed = OutOfCoreValueIteration(env, directory, block_rows)
+        result = resumed.solve(theta)
+        resume_time = time.perf_counter() - start
+        solve_time = first_time + resume_time
+        rate = result.backups / solve_time
+        print(f"  续算至收敛: 共 {result.iterations} 轮, 续算用时 {resume_time:.2f}s, "
+              f"{rate / 1e6:.1f}M backups/s")
+
+        start = time.perf_counter()
+        reference = vectorized_value_iteration(env.compile(), theta)
+        memory_time = time.perf_counter() - start
+        max_diff = float(np.abs(np.asarray(result.V, dtype=np.float64) - reference.V).max())
+        print(f"  内存版 {reference.iterations} 轮 {memory_time:.2f}s, max |ΔV| = {max_diff:.2e}")
+        del solver, resumed, result, partial
+    return {"states": env.num_states, "iterations": reference.iterations, "solve_s": solve_time,
+            "in_memory_s": memory_time, "backups_per_s": rate, "max_abs_diff": max_diff}
+
+def benchmark_parallel_value_iteration(
+    size: int = 1000,
+    worker_counts: Tuple[int, ...] = (1, 2, 4),
+    theta: float = 1e-4
+) -> List[Dict]:
+    """
+    分块并行价值迭代的扩展性: 每秒贝尔曼回溯数随进程数的变化, 并与单进程张量版逐项比较。
+    进程数超过 CPU 核数时加速比必然 ≤ 1, 表中会标出。
+    """
+    env = SimpleGridWorld(rows=size, cols=size)
+    reference = vectorized_value_iteration(env.compile(), theta)
+    cores = os.cpu_count() or 1
+    print(f"\n{size}x{size} 网格分块并行价值迭代 ({env.num_states:,} 个状态, {cores} 个 CPU 核)")
+    print(f"{'workers':>8} | {'time':>8} | {'iters':>6} | {'backups/s':>10} | {'speedup':>8} | {'max |ΔV|':>9}")
+    print("-" * 66)
+    rows, base_rate = [], None
+    for num_workers in worker_counts:
+        start = time.perf_counter()
+        result = tiled_parallel_value_iteration(env, num_workers, theta)
+        elapsed = time.perf_counter() - start
+        rate = result.backups / elapsed
+        base_rate = base_rate or rate
+        max_diff = float(np.abs(result.V - reference.V).max())
+        note = "  (> cores)" if num_workers > cores else ""
+        rows.append({"workers": num_workers, "time_s": elapsed, "iterations": result.iterations,
+                     "backups_per_s": rate, "speedup": rate / base_rate, "max_abs_diff": max_diff})
+        print(f"{num_workers:>8} | {elapsed:>7.2f}s | {result.iterations:>6} | {rate / 1e6:>9.1f}M | "
+              f"{rate / base_rate:>7.2f}x | {max_diff:>9.2e}{note}")
+    return rows
+
 if __name__ == "__main__":
     env = SimpleGridWorld()
     optimal_V = value_iteration(env)
     visualize_values(env, optimal_V)
+
+    # 打滑 (随机) 版本: 转移矩阵为 CSR 稀疏矩阵
+    slippery = SparseMDP.from_grid_world(env, slip_prob=0.2)
+    visualize_values(slippery, value_iteration(slippery), save_path='value_iteration_slippery.png')
+
+    benchmark_value_iteration()
+    benchmark_backups()
+    benchmark_policy_iteration()
+    benchmark_incremental()
+    benchmark_out_of_core()
+    benchmark_parallel_value_iteration()
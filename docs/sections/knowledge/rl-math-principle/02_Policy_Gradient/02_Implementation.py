@@ -15,9 +15,12 @@ $$\nabla_\theta J(\theta) = \mathbb{E}_{\tau \sim \pi_\theta}\left[\sum_t \nabla
 4. 策略参数的梯度上升更新
 """
 
+import contextlib
+import io
+import time
 import numpy as np
 import matplotlib.pyplot as plt
-from typing import List, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 from dataclasses import dataclass
 
 # ============================================
@@ -61,6 +64,11 @@ class SimpleBanditEnv:
             return 1.0
         else:
             return 0.0
+
+    def step_batch(self, actions: np.ndarray) -> np.ndarray:
+        """一次执行 K 个动作 (K 次独立的拉杆), 返回 K 个奖励"""
+        probs = np.asarray(self.reward_probs)[actions]
+        return (np.random.random(len(actions)) < probs).astype(np.float64)
             
     def get_optimal_action(self) -> int:
         """返回理论上的最优动作"""
@@ -110,6 +118,12 @@ class SoftmaxPolicy:
         probs = self.get_action_probabilities()
         action = np.random.choice(self.num_actions, p=probs)
         return action
+
+    def sample_actions(self, k: int) -> np.ndarray:
+        """一次采样 K 个动作: 逆 CDF, 一次 random 调用代替 K 次 np.random.choice"""
+        cdf = np.cumsum(self.get_action_probabilities())
+        actions = np.searchsorted(cdf, np.random.random(k), side='right')
+        return np.minimum(actions, self.num_actions - 1)
         
     def compute_log_prob_gradient(self, action: int) -> np.ndarray:
         """
@@ -138,6 +152,41 @@ class SoftmaxPolicy:
         grad = one_hot_a - probs
         
         return grad
+
+    def compute_batch_gradient(
+        self,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        baseline: Union[float, str] = 0.0
+    ) -> np.ndarray:
+        """
+        K 个样本的平均得分函数梯度, 一个向量化表达式完成:
+
+            g = (1/K) Σ_k (e_{a_k} - π_θ)(R_k - b_k)
+              = (1/K) [bincount(a, weights=R-b) - π_θ · Σ_k (R_k - b_k)]
+
+        Args:
+            actions: [K] 采样的动作
+            rewards: [K] 对应的奖励
+            baseline: 常数基线 (例如调用方维护的奖励滑动平均), 或 'leave_one_out':
+                      b_k = (Σ_j R_j - R_k) / (K-1), 用同批其他样本的均值, 与 a_k 独立因而无偏
+
+        基线不改变梯度的期望 (E[∇log π] = 0), 只降低方差。
+        """
+        actions = np.asarray(actions)
+        rewards = np.asarray(rewards, dtype=np.float64)
+        k = len(actions)
+        if isinstance(baseline, str):
+            if baseline != 'leave_one_out':
+                raise ValueError(f"未知基线: {baseline}")
+            if k < 2:
+                raise ValueError("leave_one_out 基线需要至少 2 个样本")
+            advantages = rewards - (rewards.sum() - rewards) / (k - 1)
+        else:
+            advantages = rewards - baseline
+        probs = self.get_action_probabilities()
+        counts = np.bincount(actions, weights=advantages, minlength=self.num_actions)
+        return (counts - probs * advantages.sum()) / k
         
     def update_parameters(self, gradient: np.ndarray, learning_rate: float):
         """
@@ -211,6 +260,149 @@ def reinforce_train(
     
     return episode_rewards
 
+def minibatch_reinforce_train(
+    env: SimpleBanditEnv,
+    policy: SoftmaxPolicy,
+    config: Config,
+    batch_size: int = 32,
+    baseline: str = 'leave_one_out',
+    learning_rate: Optional[float] = None,
+    baseline_decay: float = 0.9
+) -> List[float]:
+    """
+    小批量 REINFORCE: 每次更新前采样 batch_size 次拉杆, 用平均梯度更新一次。
+
+    总拉杆数与 reinforce_train 相同 (config.num_episodes), 更新次数少 batch_size 倍。
+    学习率默认取 config.learning_rate * batch_size, 使每个样本对参数的期望贡献不变。
+
+    Args:
+        baseline: 'none', 'running_mean' (奖励的指数滑动平均, 用更新前的值) 或 'leave_one_out'
+
+    Returns:
+        每次拉杆的奖励列表 (与 reinforce_train 的返回值可直接比较)
+    """
+    if baseline not in ('none', 'running_mean', 'leave_one_out'):
+        raise ValueError(f"未知基线: {baseline}")
+    lr = learning_rate if learning_rate is not None else config.learning_rate * batch_size
+    running_mean = 0.0
+    rewards = []
+    for start in range(0, config.num_episodes, batch_size):
+        k = min(batch_size, config.num_episodes - start)
+        actions = policy.sample_actions(k)
+        r = env.step_batch(actions)
+        if baseline == 'leave_one_out' and k > 1:
+            b = 'leave_one_out'
+        elif baseline == 'running_mean':
+            b = running_mean
+        else:
+            b = 0.0
+        policy.update_parameters(policy.compute_batch_gradient(actions, r, b), lr)
+        running_mean = baseline_decay * running_mean + (1 - baseline_decay) * r.mean()
+        rewards.extend(r.tolist())
+    return rewards
+
+# ============================================
+# 第三部分(续): 多种子批量训练
+# ============================================
+# 研究不同随机种子之间的方差时, 逐个运行 reinforce_train 要把整个 Python 循环跑 N 遍。
+# 下面把 N 个相互独立的策略叠成一个 [num_runs, num_actions] 的参数矩阵:
+# 每个回合对所有运行做一次向量化的类别采样、一次向量化的奖励抽样和一次矩阵更新。
+
+class BatchedBanditEnv:
+    """num_runs 个相互独立的 SimpleBanditEnv 副本, 一次调用为每个运行返回一个奖励"""
+    def __init__(self, num_runs: int, reward_probs: Sequence[float] = (0.2, 0.5, 0.3),
+                 rng: Optional[np.random.Generator] = None):
+        self.num_runs = num_runs
+        self.reward_probs = np.asarray(reward_probs, dtype=np.float64)
+        self.num_actions = len(self.reward_probs)
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def step(self, actions: np.ndarray) -> np.ndarray:
+        """actions: [num_runs] -> rewards: [num_runs], 以 reward_probs[a] 的概率为 1"""
+        return (self.rng.random(self.num_runs) < self.reward_probs[actions]).astype(np.float64)
+
+class BatchedSoftmaxPolicy:
+    """
+    num_runs 个独立的 Softmax 策略: theta 的第 i 行就是第 i 个运行的 SoftmaxPolicy.theta。
+    所有公式与 SoftmaxPolicy 相同, 只是多了一个批量维度。
+    """
+    def __init__(self, num_runs: int, num_actions: int, rng: Optional[np.random.Generator] = None):
+        self.theta = np.zeros((num_runs, num_actions))
+        self.num_runs = num_runs
+        self.num_actions = num_actions
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def get_action_probabilities(self) -> np.ndarray:
+        """[num_runs, num_actions], 每行按行减去最大值后做 softmax"""
+        exp_theta = np.exp(self.theta - self.theta.max(axis=1, keepdims=True))
+        return exp_theta / exp_theta.sum(axis=1, keepdims=True)
+
+    def sample_actions(self, probs: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        一次向量化的类别采样 (逆 CDF): a_i = #{j : CDF_i(j) < u_i}, u_i ~ U(0,1)
+        """
+        if probs is None:
+            probs = self.get_action_probabilities()
+        u = self.rng.random((self.num_runs, 1))
+        actions = (np.cumsum(probs, axis=1) < u).sum(axis=1)
+        return np.minimum(actions, self.num_actions - 1)  # 防止累积和的舍入误差越界
+
+    def compute_log_prob_gradient(self, actions: np.ndarray, probs: Optional[np.ndarray] = None) -> np.ndarray:
+        """逐行的 ∇_θ log π_θ(a_i) = e_{a_i} - π_θ, 形状 [num_runs, num_actions]"""
+        if probs is None:
+            probs = self.get_action_probabilities()
+        grad = -probs
+        grad[np.arange(self.num_runs), actions] += 1.0
+        return grad
+
+    def update_parameters(self, gradient: np.ndarray, learning_rate: float):
+        """θ ← θ + α * gradient (所有运行同时更新)"""
+        self.theta += learning_rate * gradient
+
+@dataclass
+class BatchedTrainingResult:
+    """批量训练的结果, 每一行对应一个独立运行"""
+    rewards: np.ndarray        # [num_runs, num_episodes] 每个回合的奖励
+    actions: np.ndarray        # [num_runs, num_episodes] 每个回合选择的动作
+    final_probs: np.ndarray    # [num_runs, num_actions] 训练结束时的策略
+
+    def learning_curves(self, window: int = 50) -> np.ndarray:
+        """每个运行的滑动平均奖励, [num_runs, num_episodes - window + 1]"""
+        c = np.cumsum(self.rewards, axis=1)
+        c = np.concatenate([np.zeros((c.shape[0], 1)), c], axis=1)
+        return (c[:, window:] - c[:, :-window]) / window
+
+def batched_reinforce_train(
+    num_runs: int,
+    config: Config,
+    reward_probs: Sequence[float] = (0.2, 0.5, 0.3),
+    seed: Optional[int] = None
+) -> BatchedTrainingResult:
+    """
+    与 reinforce_train 相同的算法, 同时训练 num_runs 个独立运行。
+
+    每个回合:
+    1. 一次向量化类别采样得到所有运行的动作 a ∈ [num_runs]
+    2. 一次向量化伯努利采样得到奖励 R ∈ [num_runs]
+    3. 梯度矩阵 (e_a - π) * R[:, None], 一次矩阵加法完成全部更新
+    """
+    rng = np.random.default_rng(seed)
+    env = BatchedBanditEnv(num_runs, reward_probs, rng)
+    policy = BatchedSoftmaxPolicy(num_runs, env.num_actions, rng)
+    rewards = np.empty((num_runs, config.num_episodes))
+    actions = np.empty((num_runs, config.num_episodes), dtype=np.int64)
+
+    for episode in range(config.num_episodes):
+        probs = policy.get_action_probabilities()
+        a = policy.sample_actions(probs)
+        r = env.step(a)
+        gradient = policy.compute_log_prob_gradient(a, probs) * r[:, None]
+        policy.update_parameters(gradient, config.learning_rate)
+        rewards[:, episode] = r
+        actions[:, episode] = a
+
+    return BatchedTrainingResult(rewards, actions, policy.get_action_probabilities())
+
 # ============================================
 # 第四部分: 可视化结果
 # ============================================
@@ -252,8 +444,170 @@ def visualize_results(
     plt.savefig('reinforce_results.png', dpi=150)
     print(">>> 结果图已保存为 reinforce_results.png")
 
+def visualize_batched_results(result: BatchedTrainingResult, window: int = 50):
+    """多种子学习曲线: 均值与 10%-90% 分位带, 以及最优动作最终概率的分布"""
+    fig, axes = plt.subplots(1, 2, figsize=(14, 5))
+
+    curves = result.learning_curves(window)
+    episodes = np.arange(window, window + curves.shape[1])
+    ax1 = axes[0]
+    ax1.fill_between(episodes, np.percentile(curves, 10, axis=0), np.percentile(curves, 90, axis=0),
+                     color='blue', alpha=0.2, label='10%-90% of runs')
+    ax1.plot(episodes, curves.mean(axis=0), color='blue', label=f'Mean over {curves.shape[0]} runs')
+    ax1.axhline(y=0.5, color='red', linestyle='--', label='Optimal Expected Reward')
+    ax1.set_xlabel('Episode')
+    ax1.set_ylabel(f'Average Reward ({window} episodes)')
+    ax1.set_title('Learning Curves Across Seeds')
+    ax1.legend()
+    ax1.grid(True, alpha=0.3)
+
+    ax2 = axes[1]
+    ax2.hist(result.final_probs[:, 1], bins=40, color='#2ecc71')
+    ax2.set_xlabel('Final π(a=1)')
+    ax2.set_ylabel('Number of runs')
+    ax2.set_title('Final Probability of the Optimal Action')
+    ax2.grid(True, alpha=0.3, axis='y')
+
+    plt.tight_layout()
+    plt.savefig('reinforce_batched_results.png', dpi=150)
+    print(">>> 多种子结果图已保存为 reinforce_batched_results.png")
+
+# ============================================
+# 第五部分: 基准测试
+# ============================================
+
+def benchmark_batched_training(num_runs: int = 1000, loop_runs: int = 20, config: Optional[Config] = None) -> dict:
+    """
+    比较逐个运行 reinforce_train 与一次 batched_reinforce_train 的单次运行耗时。
+    循环版只实际跑 loop_runs 次 (关闭打印), 按单次耗时外推到 num_runs。
+    """
+    config = config or Config()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(loop_runs):
+            reinforce_train(SimpleBanditEnv(), SoftmaxPolicy(3), config)
+    loop_per_run = (time.perf_counter() - start) / loop_runs
+
+    start = time.perf_counter()
+    result = batched_reinforce_train(num_runs, config, seed=0)
+    batched_per_run = (time.perf_counter() - start) / num_runs
+
+    final = result.final_probs[:, 1]
+    print(f"\n{num_runs} 个种子 x {config.num_episodes} 回合:")
+    print(f"  循环 reinforce_train: {loop_per_run * 1e3:8.3f} ms/run  (实测 {loop_runs} 次)")
+    print(f"  batched_reinforce_train: {batched_per_run * 1e3:8.3f} ms/run")
+    print(f"  加速比: {loop_per_run / batched_per_run:.0f}x")
+    print(f"  最终 P(a=1): 均值 {final.mean():.3f}, 标准差 {final.std():.3f}, "
+          f"10%/90% 分位 {np.percentile(final, 10):.3f}/{np.percentile(final, 90):.3f}")
+    return {"loop_ms_per_run": loop_per_run * 1e3, "batched_ms_per_run": batched_per_run * 1e3,
+            "speedup": loop_per_run / batched_per_run, "result": result}
+
+class RegretTrackingEnv(SimpleBanditEnv):
+    """
+    记录 (墙钟时间, 累计伪遗憾) 的环境包装:
+    伪遗憾 = Σ_t [max_a μ_a - μ_{a_t}], 只依赖所选动作, 不受奖励抽样噪声影响。
+    每次拉杆只累加遗憾; 每跨过 record_every 次拉杆才读一次时钟并记录一个点,
+    逐样本路径和小批量路径的插桩开销因此处于同一量级, 不会拖慢逐样本基线。
+    """
+    def __init__(self, record_every: int = 32):
+        super().__init__()
+        self.best = max(self.reward_probs)
+        self.gaps = self.best - np.asarray(self.reward_probs)
+        self._gap_list = self.gaps.tolist()
+        self.record_every = record_every
+        self.regret = 0.0
+        self.pulls = 0
+        self._next_record = record_every
+        self._recorded_pulls = 0
+        self.start = time.perf_counter()
+        self.times: List[float] = []
+        self.regrets: List[float] = []
+
+    def _record(self):
+        self.times.append(time.perf_counter() - self.start)
+        self.regrets.append(self.regret)
+        self._recorded_pulls = self.pulls
+        while self._next_record <= self.pulls:
+            self._next_record += self.record_every
+
+    def step(self, action: int) -> float:
+        reward = super().step(action)
+        self.regret += self._gap_list[action]
+        self.pulls += 1
+        if self.pulls >= self._next_record:
+            self._record()
+        return reward
+
+    def step_batch(self, actions: np.ndarray) -> np.ndarray:
+        rewards = super().step_batch(actions)
+        self.regret += float(self.gaps[actions].sum())
+        self.pulls += len(actions)
+        if self.pulls >= self._next_record:
+            self._record()
+        return rewards
+
+    def finish(self):
+        """训练结束时补记最后一个点, 保证曲线终点就是总耗时和最终遗憾。"""
+        if not self.times or self._recorded_pulls != self.pulls:
+            self._record()
+
+def benchmark_minibatch_estimators(
+    num_pulls: int = 20000,
+    batch_size: int = 32,
+    num_seeds: int = 10,
+    learning_rate: float = 0.05,
+    save_path: str = 'regret_vs_wallclock.png'
+) -> Dict[str, dict]:
+    """
+    遗憾-墙钟时间对比: 逐样本 reinforce_train vs 小批量估计器 (无基线 / 滑动平均 / 留一法)。
+    所有方法消耗相同的拉杆数, 且都按 batch_size 的拉杆步长记录曲线点; 报告耗时、吞吐和最终累计伪遗憾 (多个种子的均值 ± 标准差)。
+    在这个奖励只有 0/1 的三臂老虎机上, 基线主要体现为种子间遗憾的标准差更小。
+    """
+    config = Config(num_episodes=num_pulls, learning_rate=learning_rate)
+    methods = {
+        'per-sample loop': None,
+        'minibatch, no baseline': 'none',
+        'minibatch, running mean': 'running_mean',
+        'minibatch, leave-one-out': 'leave_one_out',
+    }
+    results = {}
+    print(f"\n遗憾 vs 墙钟时间: {num_pulls} 次拉杆, 批大小 {batch_size}, {num_seeds} 个种子")
+    print(f"{'method':>26} | {'time':>8} | {'pulls/s':>10} | {'final regret':>14}")
+    print("-" * 68)
+    plt.figure(figsize=(8, 5))
+    for name, baseline in methods.items():
+        times, regrets, curves = [], [], None
+        for seed in range(num_seeds):
+            np.random.seed(seed)
+            env, policy = RegretTrackingEnv(record_every=batch_size), SoftmaxPolicy(3)
+            if baseline is None:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    reinforce_train(env, policy, config)
+            else:
+                minibatch_reinforce_train(env, policy, config, batch_size, baseline)
+            env.finish()
+            times.append(env.times[-1])
+            regrets.append(env.regret)
+            if seed == 0:
+                curves = (np.array(env.times), np.array(env.regrets))
+        results[name] = {"time_s": float(np.mean(times)), "regret_mean": float(np.mean(regrets)),
+                         "regret_std": float(np.std(regrets))}
+        print(f"{name:>26} | {np.mean(times):>7.3f}s | {num_pulls / np.mean(times):>10,.0f} | "
+              f"{np.mean(regrets):>7.1f} ± {np.std(regrets):<5.1f}")
+        plt.plot(*curves, label=name)
+    plt.xscale('log')
+    plt.xlabel('Wall-clock time (s)')
+    plt.ylabel('Cumulative pseudo-regret')
+    plt.title(f'Regret vs Wall-Clock ({num_pulls} pulls, seed 0)')
+    plt.legend()
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(save_path, dpi=150)
+    print(f">>> 遗憾曲线已保存为 {save_path}")
+    return results
+
 # ============================================
-# 第五部分: 主程序入口
+# 第六部分: 主程序入口
 # ============================================
 
 if __name__ == "__main__":
@@ -291,3 +645,10 @@ if __name__ == "__main__":
           f"P(a=2)={policy.get_action_probabilities()[2]:.3f}")
     print("理论最优: P(a=1) ≈ 1.0 (选择期望奖励最高的动作)")
     print("=" * 60)
+
+    # 多种子: 一次向量化训练 1000 个独立运行, 观察种子间的方差
+    batched = benchmark_batched_training(num_runs=1000)
+    visualize_batched_results(batched["result"])
+
+    # 小批量 + 基线: 更少、更便宜、方差更低的更新
+    benchmark_minibatch_estimators()
@@ -12,6 +12,13 @@ arXiv: 1707.06347
 $$L^{CLIP}(\theta) = \mathbb{E}_t[\min(r_t(\theta)A_t, \text{clip}(r_t, 1-\epsilon, 1+\epsilon)A_t)]$$
 """
 
+import copy
+import math
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
 import numpy as np
 import torch
 import torch.nn as nn
@@ -20,8 +27,9 @@ import torch.nn.functional as F
 from torch.distributions import Categorical
 import matplotlib.pyplot as plt
 from typing import List, Tuple, Dict, Optional
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from collections import deque
+from multiprocessing import shared_memory
 
 # ============================================
 # 第一部分: 配置类
@@ -60,7 +68,11 @@ class PPOConfig:
     
     # 其他
     max_grad_norm: float = 0.5     # 梯度裁剪
+    target_kl: Optional[float] = None  # 某轮结束时平均近似 KL 超过该值即停止剩余轮次 (None 表示不早停)
     seed: int = 42
+    acting: str = "default"        # 采样路径: "default" / "torch" / "numpy" (见 FastActorCritic)
+    buffer: str = "list"           # 缓冲区: "list" (RolloutBuffer) / "tensor" (TensorRolloutBuffer)
+    num_envs: int = 1              # 并行环境数 (train_ppo_vectorized; 每个环境采集 rollout_steps // num_envs 步)
 
 # ============================================
 # 第二部分: Actor-Critic网络
@@ -150,10 +162,163 @@ class ActorCritic(nn.Module):
         
         return action, log_prob, entropy, value.squeeze(-1)
 
+class FastCategoricalSampler:
+    """
+    logits 列表上的低开销类别采样: 预先生成一批均匀随机数, 用完再整批补充,
+    在累积权重上做逆 CDF 比较, 全程只用 Python 标量。
+    FastActorCritic 与 03_Classic_REINFORCE 的 FastPolicyActor 共用这一份实现。
+    """
+    def __init__(self, seed: Optional[int] = None, uniform_block: int = 4096):
+        self.rng = np.random.default_rng(seed)
+        self.uniform_block = uniform_block
+        self._uniforms = self.rng.random(uniform_block).tolist()
+        self._next = 0
+
+    def _uniform(self) -> float:
+        if self._next == self.uniform_block:
+            self._uniforms = self.rng.random(self.uniform_block).tolist()
+            self._next = 0
+        u = self._uniforms[self._next]
+        self._next += 1
+        return u
+
+    def sample(self, logits: List[float]) -> Tuple[int, float]:
+        """返回 (action, log π(a|s))"""
+        top = max(logits)
+        weights = [math.exp(x - top) for x in logits]
+        total = sum(weights)
+        threshold = self._uniform() * total
+        cumulative = 0.0
+        for action, w in enumerate(weights):
+            cumulative += w
+            if cumulative >= threshold:
+                break
+        return action, math.log(weights[action] / total)
+
+class FastActorCritic:
+    """
+    逐步采样的快速路径 (PPOAgent.select_action 使用)
+    
+    默认路径每步都要新建 FloatTensor、构造 Categorical、调用三次 .item(),
+    对 4 维状态而言框架开销远大于真正的计算。这里:
+    1. 预分配 [1, state_dim] 的输入张量, 每步原地拷贝状态
+    2. 在 torch.inference_mode 下直接调用 F.linear, 绕过 Module.__call__
+    3. 逆 CDF 采样: 见 FastCategoricalSampler
+    4. backend="numpy" 时把权重复制成 NumPy 数组, 整个前向不经过 PyTorch;
+       每次 update() 之后需调用 sync() 刷新副本 (torch 后端直接共享参数)
+    03_Classic_REINFORCE 的 FastPolicyActor 是同一思路只含策略头的精简版。
+    """
+    def __init__(self, network: ActorCritic, backend: str = "torch", seed: Optional[int] = None,
+                 uniform_block: int = 4096):
+        if backend not in ("torch", "numpy"):
+            raise ValueError(f"未知的后端: {backend}")
+        self.network = network
+        self.backend = backend
+        self.sampler = FastCategoricalSampler(seed, uniform_block)
+        state_dim = network.shared[0].in_features
+        self._state = torch.empty(1, state_dim)
+        self._state_np = self._state.numpy()  # 与 _state 共享内存
+        self.sync()
+
+    def sync(self):
+        """numpy 后端: 从网络复制最新权重"""
+        if self.backend == "numpy":
+            layers = [self.network.shared[0], self.network.shared[2],
+                      self.network.actor_head, self.network.critic_head]
+            self.weights = [(l.weight.detach().numpy().copy(), l.bias.detach().numpy().copy()) for l in layers]
+
+    def forward(self, state: np.ndarray) -> Tuple[List[float], float]:
+        """返回 (logits 列表, V(s))"""
+        if self.backend == "numpy":
+            (w1, b1), (w2, b2), (wa, ba), (wc, bc) = self.weights
+            h = np.tanh(w1 @ state + b1)
+            h = np.tanh(w2 @ h + b2)
+            return (wa @ h + ba).tolist(), float(wc[0] @ h + bc[0])
+        self._state_np[0] = state
+        with torch.inference_mode():
+            net = self.network
+            h = torch.tanh(F.linear(self._state, net.shared[0].weight, net.shared[0].bias))
+            h = torch.tanh(F.linear(h, net.shared[2].weight, net.shared[2].bias))
+            logits = F.linear(h, net.actor_head.weight, net.actor_head.bias)[0].tolist()
+            value = F.linear(h, net.critic_head.weight, net.critic_head.bias).item()
+        return logits, value
+
+    def select_action(self, state: np.ndarray) -> Tuple[int, float, float]:
+        """与 PPOAgent.select_action 相同的返回值: (action, log_prob, value)"""
+        logits, value = self.forward(state)
+        action, log_prob = self.sampler.sample(logits)
+        return action, log_prob, value
+
 # ============================================
 # 第三部分: 经验回放缓冲区
 # ============================================
 
+def compute_gae_batched(
+    rewards: torch.Tensor,
+    values: torch.Tensor,
+    last_values: torch.Tensor,
+    dones: Optional[torch.Tensor] = None,
+    truncated: Optional[torch.Tensor] = None,
+    truncation_values: Optional[torch.Tensor] = None,
+    gamma: float = 0.99,
+    gae_lambda: float = 0.95,
+    method: str = "scan"
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    多环境 GAE: 输入 [T, num_envs], 返回 (advantages, returns), 形状相同
+    
+    掩码语义 (t 时刻的转移 s_t → s_{t+1}):
+        dones[t]:     真正的终止, 不自举 (V(s_{t+1}) = 0), 优势链在此截断
+        truncated[t]: 时间截断, 用 truncation_values[t] = V(s_{t+1}^final) 自举, 优势链同样截断
+                      (缓冲区里 t+1 行已经是新回合的状态)
+        last_values:  [num_envs], 最后一步之后的自举价值
+    
+    δ_t = r_t + γ m_t V_{t+1} - V_t,  A_t = δ_t + γλ c_t A_{t+1}
+    其中 m_t = 1 - dones[t], c_t = 1 - (dones[t] | truncated[t])。
+    
+    method:
+        "loop": 沿时间逐步递推 (每步处理全部环境), 作为参考实现
+        "scan": 线性递推 A_t = b_t + a_t A_{t+1} 是可结合的, 用 log2(T) 轮
+                Hillis-Steele 倍增扫描完成: (a, b)[t] ← (a_t a_{t+s}, b_t + a_t b_{t+s})。
+                系数都在 [0, 1] 内, 不存在分块累积和的溢出问题
+    """
+    rewards = torch.as_tensor(rewards, dtype=torch.float32)
+    values = torch.as_tensor(values, dtype=torch.float32)
+    T = rewards.shape[0]
+    next_values = torch.cat([values[1:], torch.as_tensor(last_values, dtype=torch.float32).reshape(1, -1)
+                             .expand(1, values.shape[1])])
+    if (truncated is None) != (truncation_values is None):
+        raise ValueError("truncated 与 truncation_values 必须同时给出")
+    chain = torch.ones_like(rewards)
+    if truncated is not None:
+        truncated = torch.as_tensor(truncated, dtype=torch.bool)
+        next_values = torch.where(truncated, torch.as_tensor(truncation_values, dtype=torch.float32), next_values)
+        chain = chain.masked_fill(truncated, 0.0)
+    if dones is not None:
+        dones = torch.as_tensor(dones, dtype=torch.bool)
+        next_values = next_values.masked_fill(dones, 0.0)
+        chain = chain.masked_fill(dones, 0.0)
+    deltas = rewards + gamma * next_values - values
+    decay = (gamma * gae_lambda) * chain
+
+    if method == "loop":
+        advantages = torch.empty_like(deltas)
+        gae = torch.zeros_like(deltas[0])
+        for t in reversed(range(T)):
+            gae = deltas[t] + decay[t] * gae
+            advantages[t] = gae
+    elif method == "scan":
+        a, b = decay, deltas
+        shift = 1
+        while shift < T:
+            b = torch.cat([torch.addcmul(b[:-shift], a[:-shift], b[shift:]), b[-shift:]])
+            a = torch.cat([a[:-shift] * a[shift:], a[-shift:]])
+            shift *= 2
+        advantages = b
+    else:
+        raise ValueError(f"未知的 method: {method}")
+    return advantages, advantages + values
+
 class RolloutBuffer:
     """
     滚动缓冲区
@@ -203,31 +368,22 @@ class RolloutBuffer:
         δ_t = r_t + γ V(s_{t+1}) - V(s_t)
         A_t = δ_t + γλ A_{t+1}
         
-        从后往前递归计算
+        由 compute_gae_batched 在 [T, 1] 上一次算完 (不再逐步做 Python 标量递推)
         """
-        T = len(self.rewards)
-        self.advantages = [0.0] * T
-        self.returns = [0.0] * T
-        
-        # 从最后一步开始
-        gae = 0
-        for t in reversed(range(T)):
-            if t == T - 1:
-                next_value = last_value
-                next_non_terminal = 1.0 - float(self.dones[t])
-            else:
-                next_value = self.values[t + 1]
-                next_non_terminal = 1.0 - float(self.dones[t])
-            
-            # TD误差: δ_t = r_t + γ * V(s') - V(s)
-            delta = self.rewards[t] + gamma * next_value * next_non_terminal - self.values[t]
-            
-            # GAE: A_t = δ_t + γλ * A_{t+1}
-            gae = delta + gamma * gae_lambda * next_non_terminal * gae
-            self.advantages[t] = gae
-            
-            # 目标价值: V_target = A_t + V(s_t)
-            self.returns[t] = gae + self.values[t]
+        advantages, returns = compute_gae_batched(
+            torch.tensor(self.rewards, dtype=torch.float32)[:, None],
+            torch.tensor(self.values, dtype=torch.float32)[:, None],
+            torch.tensor([last_value], dtype=torch.float32),
+            dones=torch.tensor(self.dones, dtype=torch.bool)[:, None],
+            gamma=gamma, gae_lambda=gae_lambda)
+        self.advantages = advantages.squeeze(1).tolist()
+        self.returns = returns.squeeze(1).tolist()
+    
+    def normalize_advantages(self):
+        """标准化优势（减少方差）"""
+        advantages = torch.FloatTensor(self.advantages)
+        advantages = (advantages - advantages.mean()) / (advantages.std() + 1e-8)
+        self.advantages = advantages.tolist()
     
     def get_batches(self, batch_size: int):
         """
@@ -261,6 +417,122 @@ class RolloutBuffer:
         self.advantages = []
         self.returns = []
 
+class TensorRolloutBuffer:
+    """
+    预分配的滚动缓冲区, 接口与 RolloutBuffer 相同
+    
+    所有字段在构造时一次性分配为 [rollout_steps, num_envs, ...] 的 numpy 数组,
+    并通过 torch.from_numpy 共享同一块内存: add() 原地写入一行, clear() 只重置游标。
+    get_batches() 每轮只做一次随机置换 (每个字段一次 gather), 之后的小批量都是
+    置换结果上的连续切片 (零拷贝视图), 不再逐元素重建张量。
+    """
+    def __init__(self, rollout_steps: int, state_dim: int, num_envs: int = 1):
+        self.rollout_steps = rollout_steps
+        self.num_envs = num_envs
+        shape = (rollout_steps, num_envs)
+        self._states = np.zeros(shape + (state_dim,), dtype=np.float32)
+        self._actions = np.zeros(shape, dtype=np.int64)
+        self._log_probs = np.zeros(shape, dtype=np.float32)
+        self._rewards = np.zeros(shape, dtype=np.float32)
+        self._values = np.zeros(shape, dtype=np.float32)
+        self._dones = np.zeros(shape, dtype=np.float32)
+        self._advantages = np.zeros(shape, dtype=np.float32)
+        self._returns = np.zeros(shape, dtype=np.float32)
+        self._importance_weights = np.ones(shape, dtype=np.float32)  # 见 PPOAgent.correct_behavior_policy
+        self.pos = 0
+        
+    def __len__(self) -> int:
+        return self.pos * self.num_envs
+        
+    def add(
+        self,
+        state: np.ndarray,
+        action: int,
+        log_prob: float,
+        reward: float,
+        value: float,
+        done: bool
+    ):
+        """添加一步经验 (num_envs > 1 时每个参数是长度为 num_envs 的数组)"""
+        if self.pos >= self.rollout_steps:
+            raise IndexError(f"缓冲区已满 (rollout_steps = {self.rollout_steps})")
+        t = self.pos
+        row = (t, 0) if self.num_envs == 1 else t  # 单环境时用完整下标写标量, 避免切片广播
+        self._states[t] = state
+        self._actions[row] = action
+        self._log_probs[row] = log_prob
+        self._rewards[row] = reward
+        self._values[row] = value
+        self._dones[row] = done
+        self.pos += 1
+        
+    def compute_returns_and_advantages(
+        self,
+        last_value,
+        gamma: float,
+        gae_lambda: float
+    ):
+        """GAE, 与 RolloutBuffer 相同的递推, 由 compute_gae_batched 一次处理 [T, num_envs]"""
+        T = self.pos
+        last_values = np.broadcast_to(np.asarray(last_value, dtype=np.float32), (self.num_envs,))
+        advantages, returns = compute_gae_batched(
+            torch.from_numpy(self._rewards[:T]), torch.from_numpy(self._values[:T]),
+            torch.from_numpy(last_values.copy()), dones=torch.from_numpy(self._dones[:T] > 0),
+            gamma=gamma, gae_lambda=gae_lambda)
+        self._advantages[:T] = advantages.numpy()
+        self._returns[:T] = returns.numpy()
+        
+    def _flat(self, array: np.ndarray) -> torch.Tensor:
+        """已写入部分展平为 [pos * num_envs, ...] 的张量视图 (共享内存)"""
+        return torch.from_numpy(array[:self.pos].reshape((len(self),) + array.shape[2:]))
+        
+    @property
+    def states(self) -> torch.Tensor:
+        return self._flat(self._states)
+        
+    @property
+    def actions(self) -> torch.Tensor:
+        return self._flat(self._actions)
+        
+    @property
+    def log_probs(self) -> torch.Tensor:
+        return self._flat(self._log_probs)
+        
+    @property
+    def advantages(self) -> torch.Tensor:
+        return self._flat(self._advantages)
+        
+    @property
+    def returns(self) -> torch.Tensor:
+        return self._flat(self._returns)
+        
+    @property
+    def importance_weights(self) -> torch.Tensor:
+        return self._flat(self._importance_weights)
+        
+    def normalize_advantages(self):
+        """
+        原地标准化优势, 然后逐样本乘以重要性权重 (默认全为 1)
+        权重在标准化之后才乘: 否则减均值会让被缩小的优势改变符号, 修正被抵消
+        """
+        advantages = self.advantages
+        advantages.sub_(advantages.mean()).div_(advantages.std() + 1e-8)
+        advantages.mul_(self.importance_weights)
+        
+    def get_batches(self, batch_size: int):
+        """一次置换 + 连续切片; 每次调用 (每个 epoch) 重新置换"""
+        fields = [self._flat(a) for a in (self._states, self._actions, self._log_probs,
+                                          self._advantages, self._returns)]
+        permutation = torch.from_numpy(np.random.permutation(len(self)))
+        shuffled = [f[permutation] for f in fields]
+        for start in range(0, len(self), batch_size):
+            yield tuple(f[start:start + batch_size] for f in shuffled)
+            
+    def clear(self):
+        """重置游标, 不释放内存"""
+        self._importance_weights[:self.pos] = 1.0
+        self.pos = 0
+
 # ============================================
 # 第四部分: PPO损失计算
 # ============================================
@@ -330,7 +602,16 @@ class PPOAgent:
         )
         
         # 经验缓冲区
-        self.buffer = RolloutBuffer()
+        if config.buffer == "tensor":
+            self.buffer = TensorRolloutBuffer(config.rollout_steps // config.num_envs, config.state_dim,
+                                              config.num_envs)
+        else:
+            self.buffer = RolloutBuffer()
+
+        # 可选的快速采样路径
+        self.fast_actor = None
+        if config.acting != "default":
+            self.fast_actor = FastActorCritic(self.network, config.acting, seed=config.seed)
         
     def select_action(self, state: np.ndarray) -> Tuple[int, float, float]:
         """
@@ -341,6 +622,9 @@ class PPOAgent:
             log_prob: 对数概率
             value: 状态价值
         """
+        if self.fast_actor is not None:
+            return self.fast_actor.select_action(state)
+        
         state_t = torch.FloatTensor(state).unsqueeze(0)
         
         with torch.no_grad():
@@ -348,28 +632,55 @@ class PPOAgent:
         
         return action.item(), log_prob.item(), value.item()
     
+    def select_actions(self, states: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        对一批状态 [num_envs, state_dim] 一次前向, 返回 (actions, log_probs, values) 三个 numpy 数组
+        """
+        with torch.no_grad():
+            action, log_prob, _, value = self.network.get_action_and_value(torch.as_tensor(states, dtype=torch.float32))
+        return action.numpy(), log_prob.numpy(), value.numpy()
+    
+    def correct_behavior_policy(self) -> float:
+        """
+        缓冲区由旧快照 μ 采集时 (异步采样) 的修正, 需要 TensorRolloutBuffer:
+        以当前网络 π_prox 作为裁剪的锚点 (替换缓冲区里的 log μ), 并记录截断重要性权重
+        w = min(1, π_prox / μ); update() 标准化优势之后再逐样本乘以 w。返回 w 的均值, 1 表示没有偏移。
+        """
+        with torch.no_grad():
+            _, proximal, _, _ = self.network.get_action_and_value(self.buffer.states, self.buffer.actions)
+            behavior = self.buffer.log_probs
+            weights = torch.exp(proximal - behavior).clamp_(max=1.0)
+            self.buffer.importance_weights.copy_(weights)
+            behavior.copy_(proximal)
+        return weights.mean().item()
+    
     def update(self) -> Dict[str, float]:
         """
         PPO更新
         
         使用缓冲区中的数据进行多轮优化
         
+        日志量在设备上累加 (不对每个小批量调用 .item()), 更新结束时一次性取回。
+        设置 target_kl 时, 每轮结束检查一次该轮的平均近似 KL
+            KL(π_old || π_θ) ≈ E[(r - 1) - log r],  r = π_θ / π_old
+        (非负、低方差的 k3 估计, 直接用 get_action_and_value 已算出的 log_prob),
+        超过阈值就放弃剩余轮次。
+        
         Returns:
-            logs: 训练日志
+            logs: 训练日志 (含 approx_kl 与实际运行的轮数 epochs)
         """
         # 标准化优势（减少方差）
-        advantages = torch.FloatTensor(self.buffer.advantages)
-        advantages = (advantages - advantages.mean()) / (advantages.std() + 1e-8)
-        self.buffer.advantages = advantages.tolist()
+        self.buffer.normalize_advantages()
         
-        # 记录
-        total_policy_loss = 0
-        total_value_loss = 0
-        total_entropy = 0
+        # 记录 (设备上的累加器: policy_loss, value_loss, entropy, approx_kl)
+        totals = torch.zeros(4)
         num_batches = 0
+        epochs = 0
         
         # K轮优化
         for _ in range(self.config.num_epochs):
+            epoch_kl = torch.zeros(())
+            epoch_batches = 0
             for batch in self.buffer.get_batches(self.config.batch_size):
                 states, actions, old_log_probs, advs, returns = batch
                 
@@ -408,18 +719,31 @@ class PPOAgent:
                 self.optimizer.step()
                 
                 # 记录
-                total_policy_loss += policy_loss.item()
-                total_value_loss += value_loss.item()
-                total_entropy += entropy.mean().item()
+                with torch.no_grad():
+                    log_ratio = new_log_probs - old_log_probs
+                    approx_kl = (torch.exp(log_ratio) - 1 - log_ratio).mean()
+                    totals += torch.stack([policy_loss, value_loss, -entropy_loss, approx_kl])
+                    epoch_kl += approx_kl
                 num_batches += 1
+                epoch_batches += 1
+            
+            epochs += 1
+            # KL 早停: 每轮只同步一次
+            if self.config.target_kl is not None and epoch_kl.item() / epoch_batches > self.config.target_kl:
+                break
         
         # 清空缓冲区
         self.buffer.clear()
+        if self.fast_actor is not None:
+            self.fast_actor.sync()
         
+        policy_loss, value_loss, entropy, approx_kl = (totals / num_batches).tolist()
         return {
-            "policy_loss": total_policy_loss / num_batches,
-            "value_loss": total_value_loss / num_batches,
-            "entropy": total_entropy / num_batches
+            "policy_loss": policy_loss,
+            "value_loss": value_loss,
+            "entropy": entropy,
+            "approx_kl": approx_kl,
+            "epochs": epochs
         }
 
 # ============================================
@@ -474,6 +798,130 @@ class SimpleCartPoleEnv:
         
         return self.state.copy(), reward, done
 
+_VECTOR_ENV_STEP, _VECTOR_ENV_RESET, _VECTOR_ENV_CLOSE = 0, 1, 2
+
+def _vector_env_layout(num_envs: int, state_dim: int = 4) -> List[Tuple[str, Tuple[int, ...], type]]:
+    """
+    共享内存布局 (按顺序紧密排列), 块大小与各数组视图都由这张表导出:
+        command [1] int64 | actions [num_envs] int64 | obs [num_envs, state_dim] float32
+        rewards [num_envs] float32 | dones [num_envs] bool
+    """
+    return [("command", (1,), np.int64), ("actions", (num_envs,), np.int64),
+            ("obs", (num_envs, state_dim), np.float32), ("rewards", (num_envs,), np.float32),
+            ("dones", (num_envs,), np.bool_)]
+
+def _vector_env_nbytes(num_envs: int, state_dim: int = 4) -> int:
+    return sum(math.prod(shape) * np.dtype(dtype).itemsize for _, shape, dtype in _vector_env_layout(num_envs, state_dim))
+
+def _vector_env_arrays(buf, num_envs: int, state_dim: int = 4) -> Dict[str, np.ndarray]:
+    """主进程与 worker 用同一函数把同一块内存解释为各个数组"""
+    arrays, offset = {}, 0
+    for name, shape, dtype in _vector_env_layout(num_envs, state_dim):
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+        offset += arrays[name].nbytes
+    return arrays
+
+def _vector_env_worker(shm_name: str, num_envs: int, start: int, stop: int, barrier, seed: int) -> None:
+    """
+    worker 常驻循环: 屏障 → 读命令 → 推进自己负责的 [start, stop) 个环境 → 屏障
+    结束的环境立即重置, 写回的 obs 是新回合的初始状态
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = _vector_env_arrays(shm.buf, num_envs)
+    command, actions, obs, rewards, dones = (arrays[k] for k in ("command", "actions", "obs", "rewards", "dones"))
+    try:
+        np.random.seed(seed)
+        envs = [SimpleCartPoleEnv() for _ in range(start, stop)]
+        while True:
+            barrier.wait()
+            if command[0] == _VECTOR_ENV_CLOSE:
+                break
+            if command[0] == _VECTOR_ENV_RESET:
+                for i, env in enumerate(envs, start):
+                    obs[i] = env.reset()
+            else:
+                for i, env in enumerate(envs, start):
+                    state, reward, done = env.step(int(actions[i]))
+                    obs[i] = env.reset() if done else state
+                    rewards[i] = reward
+                    dones[i] = done
+            barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    except BaseException:
+        barrier.abort()
+        raise
+    finally:
+        del command, actions, obs, rewards, dones, arrays
+        shm.close()
+
+class SharedMemoryVectorEnv:
+    """
+    多进程向量环境: num_workers 个常驻进程, 每个负责 envs_per_worker 个 SimpleCartPoleEnv
+    
+    观测、奖励、done 与动作都放在一块 multiprocessing.shared_memory 里, 每步不做任何 pickle:
+        主进程写 actions → 屏障 (唤醒 worker) → worker 原地写 obs / rewards / dones → 屏障 (等待完成)
+    接口与 SimpleCartPoleEnv 一致, 只是每个量多了 [num_envs] 维; 结束的环境自动重置。
+    """
+    def __init__(self, num_workers: int = 2, envs_per_worker: int = 8, seed: int = 0, timeout: float = 60.0):
+        self.num_envs = num_workers * envs_per_worker
+        self.timeout = timeout
+        self._shm = shared_memory.SharedMemory(create=True, size=_vector_env_nbytes(self.num_envs))
+        self._arrays = _vector_env_arrays(self._shm.buf, self.num_envs)
+        ctx = mp.get_context()
+        self._barrier = ctx.Barrier(num_workers + 1)
+        self._workers = [
+            ctx.Process(target=_vector_env_worker, daemon=True,
+                        args=(self._shm.name, self.num_envs, w * envs_per_worker, (w + 1) * envs_per_worker,
+                              self._barrier, seed + w))
+            for w in range(num_workers)
+        ]
+        for p in self._workers:
+            p.start()
+        self.closed = False
+
+    def _run(self, command: int):
+        self._arrays["command"][0] = command
+        try:
+            self._barrier.wait(self.timeout)
+            self._barrier.wait(self.timeout)
+        except threading.BrokenBarrierError:
+            self.close()
+            raise RuntimeError("向量环境的 worker 异常退出或超时")
+
+    def reset(self) -> np.ndarray:
+        self._run(_VECTOR_ENV_RESET)
+        return self._arrays["obs"].copy()
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        self._arrays["actions"][:] = actions
+        self._run(_VECTOR_ENV_STEP)
+        return self._arrays["obs"].copy(), self._arrays["rewards"].copy(), self._arrays["dones"].copy()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if not self._barrier.broken:
+            self._arrays["command"][0] = _VECTOR_ENV_CLOSE
+            try:
+                self._barrier.wait(self.timeout)
+            except threading.BrokenBarrierError:
+                pass
+        for p in self._workers:
+            p.join(timeout=self.timeout)
+            if p.is_alive():
+                p.terminate()
+        self._arrays.clear()
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self) -> "SharedMemoryVectorEnv":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 # ============================================
 # 第七部分: 训练主循环
 # ============================================
@@ -541,10 +989,446 @@ def train_ppo(config: PPOConfig) -> Dict:
             print(f"  策略损失: {logs['policy_loss']:.4f}")
             print(f"  价值损失: {logs['value_loss']:.4f}")
             print(f"  熵: {logs['entropy']:.4f}")
+            print(f"  近似KL: {logs['approx_kl']:.4f} ({logs['epochs']}/{config.num_epochs} 轮)")
             print()
     
     return {"rewards": all_rewards, "lengths": all_lengths, "agent": agent}
 
+def _collect_rollout(actor: ActorCritic, env: SimpleCartPoleEnv, buffer: TensorRolloutBuffer,
+                     state: np.ndarray, episode: Dict, config: PPOConfig) -> np.ndarray:
+    """用网络 actor 填满 buffer 并计算 GAE; episode 记录进行中的回合奖励与已完成回合的奖励列表"""
+    for _ in range(buffer.rollout_steps):
+        with torch.no_grad():
+            action, log_prob, _, value = actor.get_action_and_value(torch.as_tensor(state, dtype=torch.float32)[None])
+        action = action.item()
+        next_state, reward, done = env.step(action)
+        buffer.add(state, action, log_prob.item(), reward, value.item(), done)
+        episode["reward"] += reward
+        state = next_state
+        if done:
+            episode["finished"].append(episode["reward"])
+            episode["reward"] = 0.0
+            state = env.reset()
+    with torch.no_grad():
+        _, _, _, last_value = actor.get_action_and_value(torch.as_tensor(state, dtype=torch.float32)[None])
+    buffer.compute_returns_and_advantages(last_value.item(), config.gamma, config.gae_lambda)
+    return state
+
+def train_ppo_double_buffered(config: PPOConfig, asynchronous: bool = True, correct_staleness: bool = True,
+                              verbose: bool = True) -> Dict:
+    """
+    双缓冲 PPO: 两个 TensorRolloutBuffer 轮流使用
+    
+    asynchronous=True 时采样在单独的线程里进行: 采样线程用 ActorCritic 的快照填一个缓冲区,
+    学习者同时在另一个缓冲区上优化; 每次更新后学习者发布新权重 (带版本号), 采样线程在
+    拿到空闲缓冲区后载入 (学习者先发布权重、再归还缓冲区)。缓冲区的滞后 (staleness) =
+    学习者版本 - 采样时的版本; 由于同时只有两个缓冲区, 稳态下为 1 (更新比采样慢时也是如此)。
+    correct_staleness=True 时对滞后的缓冲区调用
+    PPOAgent.correct_behavior_policy (以当前策略为裁剪锚点, 截断重要性加权)。
+    asynchronous=False 时退化为与 train_ppo 相同的交替执行, 作为对照。
+    
+    只有在有多个 CPU 核时采样与更新才能真正并行 (env 的 Python 代码与 PyTorch 算子
+    在后者释放 GIL 时重叠)。
+    """
+    config = replace(config, buffer="tensor", num_envs=1)
+    torch.manual_seed(config.seed)
+    np.random.seed(config.seed)
+    agent = PPOAgent(config)
+    actor = copy.deepcopy(agent.network)
+    free_buffers, full_buffers = queue.Queue(), queue.Queue()
+    for _ in range(2):
+        free_buffers.put(TensorRolloutBuffer(config.rollout_steps, config.state_dim))
+    lock = threading.Lock()
+    published = {"version": 0, "state_dict": copy.deepcopy(agent.network.state_dict())}
+    env, episode = SimpleCartPoleEnv(), {"reward": 0.0, "finished": []}
+    collector_state = {"state": env.reset(), "version": -1}
+
+    def collect_one():
+        # 先拿到空闲缓冲区再载入权重: 等待期间学习者可能已经发布了新版本
+        buffer = free_buffers.get()
+        with lock:
+            if published["version"] != collector_state["version"]:
+                actor.load_state_dict(published["state_dict"])
+                collector_state["version"] = published["version"]
+        collector_state["state"] = _collect_rollout(actor, env, buffer, collector_state["state"], episode, config)
+        full_buffers.put((buffer, collector_state["version"]))
+
+    def collector():
+        try:
+            for _ in range(config.num_updates):
+                collect_one()
+        except BaseException as error:
+            full_buffers.put((error, None))
+
+    staleness, weights, logs = [], [], {}
+    start = time.perf_counter()
+    thread = None
+    if asynchronous:
+        thread = threading.Thread(target=collector, daemon=True)
+        thread.start()
+    for update in range(1, config.num_updates + 1):
+        if not asynchronous:
+            collect_one()
+        buffer, behavior_version = full_buffers.get()
+        if isinstance(buffer, BaseException):
+            raise buffer
+        lag = published["version"] - behavior_version
+        staleness.append(lag)
+        agent.buffer = buffer
+        if correct_staleness and lag > 0:
+            weights.append(agent.correct_behavior_policy())
+        logs = agent.update()
+        # 先发布新权重再归还缓冲区, 采样线程拿到缓冲区时一定能看到这次更新
+        with lock:
+            published["state_dict"] = copy.deepcopy(agent.network.state_dict())
+            published["version"] += 1
+        free_buffers.put(buffer)
+        if verbose and update % 10 == 0 and episode["finished"]:
+            print(f"Update {update}/{config.num_updates} | 平均奖励: {np.mean(episode['finished'][-20:]):.1f} | "
+                  f"滞后: {lag} | 近似KL: {logs['approx_kl']:.4f}")
+    if thread is not None:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {"rewards": episode["finished"], "agent": agent, "elapsed_s": elapsed,
+            "samples_per_s": config.num_updates * config.rollout_steps / elapsed,
+            "staleness": staleness, "importance_weights": weights}
+
+def train_ppo_vectorized(config: PPOConfig, num_workers: int = 2, envs_per_worker: int = 4) -> Dict:
+    """
+    与 train_ppo 相同的 PPO, 但采样在 SharedMemoryVectorEnv 上进行:
+    每步对全部 num_workers * envs_per_worker 个环境做一次批量前向 (select_actions),
+    每次更新使用 rollout_steps 条样本 (每个环境 rollout_steps // num_envs 步)
+    """
+    num_envs = num_workers * envs_per_worker
+    config = replace(config, num_envs=num_envs, buffer="tensor")
+    torch.manual_seed(config.seed)
+    np.random.seed(config.seed)
+    agent = PPOAgent(config)
+    steps_per_env = config.rollout_steps // num_envs
+
+    all_rewards = []
+    episode_rewards = np.zeros(num_envs)
+    print("=" * 60)
+    print(f"向量化 PPO 训练开始 | {num_workers} 个 worker x {envs_per_worker} 个环境 | "
+          f"每次更新 {steps_per_env * num_envs} 条样本")
+    print("=" * 60)
+
+    with SharedMemoryVectorEnv(num_workers, envs_per_worker, seed=config.seed) as env:
+        states = env.reset()
+        for update in range(1, config.num_updates + 1):
+            for _ in range(steps_per_env):
+                actions, log_probs, values = agent.select_actions(states)
+                next_states, rewards, dones = env.step(actions)
+                agent.buffer.add(states, actions, log_probs, rewards, values, dones)
+                episode_rewards += rewards
+                all_rewards.extend(episode_rewards[dones].tolist())
+                episode_rewards[dones] = 0.0
+                states = next_states
+
+            _, _, last_values = agent.select_actions(states)
+            agent.buffer.compute_returns_and_advantages(last_values, config.gamma, config.gae_lambda)
+            logs = agent.update()
+
+            if update % 10 == 0 and len(all_rewards) > 0:
+                print(f"Update {update}/{config.num_updates}")
+                print(f"  平均奖励: {np.mean(all_rewards[-20:]):.1f}")
+                print(f"  策略损失: {logs['policy_loss']:.4f}")
+                print(f"  价值损失: {logs['value_loss']:.4f}")
+                print()
+
+    return {"rewards": all_rewards, "agent": agent}
+
+def benchmark_action_selection(num_steps: int = 5000) -> Dict[str, float]:
+    """单步 select_action 延迟 (μs/step): 默认路径 vs FastActorCritic 的 torch / numpy 后端"""
+    states = np.random.default_rng(0).normal(scale=0.05, size=(num_steps, 4))
+    results = {}
+    print(f"\n单步动作选择延迟 ({num_steps} 步)")
+    for acting in ("default", "torch", "numpy"):
+        torch.manual_seed(0)
+        agent = PPOAgent(PPOConfig(acting=acting))
+        start = time.perf_counter()
+        for state in states:
+            agent.select_action(state)
+        results[acting] = (time.perf_counter() - start) / num_steps * 1e6
+        print(f"  {acting:>8}: {results[acting]:6.1f} μs/step")
+    return results
+
+def benchmark_rollout_buffer(rollout_steps: int = 2048, num_epochs: int = 4, batch_size: int = 64,
+                             repeats: int = 3) -> List[Dict]:
+    """
+    RolloutBuffer (Python 列表) vs TensorRolloutBuffer (预分配数组):
+    相同的经验数据、相同的网络初始化与置换种子, 比较 (repeats 次取最快):
+        fill + GAE: 逐步 add() 与优势计算
+        batching:   K 轮 get_batches() 本身 (不含网络计算)
+        update:     完整的 update() (包含前向/反向, 两者相同)
+    """
+    rng = np.random.default_rng(0)
+    states = rng.normal(scale=0.05, size=(rollout_steps, 4))
+    actions = rng.integers(0, 2, size=rollout_steps)
+    log_probs = np.log(rng.uniform(0.3, 0.7, size=rollout_steps))
+    rewards = rng.uniform(size=rollout_steps)
+    values = rng.normal(size=rollout_steps)
+    dones = rng.uniform(size=rollout_steps) < 0.05
+    results = []
+    print(f"\n缓冲区对比: rollout_steps = {rollout_steps}, K = {num_epochs}, batch = {batch_size}")
+    print(f"{'buffer':>7} | {'fill + GAE':>10} | {'batching':>9} | {'speedup':>8} | {'update':>9} | "
+          f"{'speedup':>8} | {'policy loss':>11}")
+    print("-" * 83)
+    base_batching = base = None
+    for buffer in ("list", "tensor"):
+        config = PPOConfig(rollout_steps=rollout_steps, num_epochs=num_epochs, batch_size=batch_size, buffer=buffer)
+        fill_times, batching_times, update_times = [], [], []
+        for _ in range(repeats):
+            torch.manual_seed(0)
+            np.random.seed(0)
+            agent = PPOAgent(config)
+            start = time.perf_counter()
+            for t in range(rollout_steps):
+                agent.buffer.add(states[t], int(actions[t]), float(log_probs[t]), float(rewards[t]),
+                                 float(values[t]), bool(dones[t]))
+            agent.buffer.compute_returns_and_advantages(0.0, config.gamma, config.gae_lambda)
+            fill_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            for _ in range(num_epochs):
+                for _ in agent.buffer.get_batches(batch_size):
+                    pass
+            batching_times.append(time.perf_counter() - start)
+            np.random.seed(0)
+            start = time.perf_counter()
+            logs = agent.update()
+            update_times.append(time.perf_counter() - start)
+        base = base or min(update_times)
+        base_batching = base_batching or min(batching_times)
+        results.append({"buffer": buffer, "fill_s": min(fill_times), "batching_s": min(batching_times),
+                        "update_s": min(update_times), "policy_loss": logs["policy_loss"]})
+        print(f"{buffer:>7} | {min(fill_times) * 1e3:>8.1f}ms | {min(batching_times) * 1e3:>7.1f}ms | "
+              f"{base_batching / min(batching_times):>7.2f}x | {min(update_times) * 1e3:>7.1f}ms | "
+              f"{base / min(update_times):>7.2f}x | {logs['policy_loss']:>11.5f}")
+    return results
+
+def _gae_reference_loop(rewards: np.ndarray, values: np.ndarray, last_values: np.ndarray,
+                        dones: np.ndarray, gamma: float, gae_lambda: float) -> np.ndarray:
+    """逐环境的标量递推 (与 RolloutBuffer.compute_returns_and_advantages 相同), 作为基准"""
+    T, num_envs = rewards.shape
+    advantages = np.zeros((T, num_envs))
+    for env in range(num_envs):
+        r, v, d = rewards[:, env].tolist(), values[:, env].tolist(), dones[:, env].tolist()
+        gae, next_value = 0.0, float(last_values[env])
+        for t in reversed(range(T)):
+            next_non_terminal = 1.0 - float(d[t])
+            delta = r[t] + gamma * next_value * next_non_terminal - v[t]
+            gae = delta + gamma * gae_lambda * next_non_terminal * gae
+            advantages[t, env] = gae
+            next_value = v[t]
+    return advantages
+
+def benchmark_gae(shapes: List[Tuple[int, int]] = ((100_000, 1), (2048, 64), (512, 1024)),
+                  gamma: float = 0.99, gae_lambda: float = 0.95) -> List[Dict]:
+    """
+    GAE 三种实现的耗时与数值误差 (相对标量循环, float64):
+        Python 标量循环 / compute_gae_batched(method="loop") / compute_gae_batched(method="scan")
+    另外在 [T, num_envs] 上核对截断掩码: 截断处用 truncation_values 自举, 等价于把该处 reward 加上 γ V_final 并视为终止
+    """
+    results = []
+    print(f"\nGAE 基准 (γ = {gamma}, λ = {gae_lambda})")
+    print(f"{'T x envs':>14} | {'python loop':>11} | {'tensor loop':>11} | {'scan':>9} | {'speedup':>8} | "
+          f"{'max |Δ| loop':>12} | {'max |Δ| scan':>12}")
+    print("-" * 96)
+    for T, num_envs in shapes:
+        rng = np.random.default_rng(0)
+        rewards = rng.normal(size=(T, num_envs)).astype(np.float32)
+        values = rng.normal(size=(T, num_envs)).astype(np.float32)
+        last_values = rng.normal(size=num_envs).astype(np.float32)
+        dones = rng.uniform(size=(T, num_envs)) < 0.01
+        start = time.perf_counter()
+        reference = _gae_reference_loop(rewards, values, last_values, dones, gamma, gae_lambda)
+        python_time = time.perf_counter() - start
+        tensors = [torch.from_numpy(x) for x in (rewards, values, last_values, dones)]
+        times, errors = {}, {}
+        for method in ("loop", "scan"):
+            compute_gae_batched(*[x[:8] if x.dim() == 2 else x for x in tensors], method=method)  # 预热
+            start = time.perf_counter()
+            advantages, _ = compute_gae_batched(*tensors, gamma=gamma, gae_lambda=gae_lambda, method=method)
+            times[method] = time.perf_counter() - start
+            errors[method] = np.abs(advantages.numpy() - reference).max()
+        results.append({"T": T, "num_envs": num_envs, "python_s": python_time, "loop_s": times["loop"],
+                        "scan_s": times["scan"], "loop_err": errors["loop"], "scan_err": errors["scan"]})
+        print(f"{f'{T} x {num_envs}':>14} | {python_time * 1e3:>9.1f}ms | {times['loop'] * 1e3:>9.1f}ms | "
+              f"{times['scan'] * 1e3:>7.2f}ms | {python_time / times['scan']:>7.0f}x | "
+              f"{errors['loop']:>12.1e} | {errors['scan']:>12.1e}")
+
+    # 截断掩码的核对
+    rng = np.random.default_rng(1)
+    rewards, values = torch.randn(200, 8), torch.randn(200, 8)
+    last_values, truncation_values = torch.randn(8), torch.randn(200, 8)
+    dones = torch.from_numpy(rng.uniform(size=(200, 8)) < 0.02)
+    truncated = torch.from_numpy(rng.uniform(size=(200, 8)) < 0.02) & ~dones
+    advantages, _ = compute_gae_batched(rewards, values, last_values, dones, truncated, truncation_values,
+                                        gamma, gae_lambda)
+    folded = rewards + gamma * truncation_values * truncated
+    expected, _ = compute_gae_batched(folded, values, last_values, dones | truncated,
+                                      gamma=gamma, gae_lambda=gae_lambda, method="loop")
+    print(f"截断掩码核对: max |Δ| = {(advantages - expected).abs().max().item():.1e}")
+    return results
+
+def benchmark_vector_env(total_envs: int = 32, num_steps: int = 300,
+                         worker_counts: List[int] = (1, 2, 4)) -> List[Dict]:
+    """
+    采样吞吐量 (环境步/秒, 含策略前向):
+        serial:     train_ppo 的方式, 单个环境, 每步一次 select_action
+        K workers:  SharedMemoryVectorEnv, total_envs 个环境平均分给 K 个进程, 每步一次批量 select_actions
+    多进程的收益取决于可用的 CPU 核数 (这里同时打印 os.cpu_count())
+    """
+    uneven = [k for k in worker_counts if total_envs % k != 0]
+    if uneven:
+        raise ValueError(f"total_envs = {total_envs} 不能被 worker 数 {uneven} 整除")
+    agent = PPOAgent(PPOConfig())
+    results = []
+    print(f"\n向量环境吞吐量: {total_envs} 个环境, 每个 {num_steps} 步, CPU 核数 = {os.cpu_count()}")
+    print(f"{'mode':>12} | {'steps/s':>10} | {'speedup':>8}")
+    print("-" * 36)
+
+    env = SimpleCartPoleEnv()
+    state = env.reset()
+    start = time.perf_counter()
+    for _ in range(num_steps * 4):
+        action, _, _ = agent.select_action(state)
+        state, _, done = env.step(action)
+        if done:
+            state = env.reset()
+    serial = num_steps * 4 / (time.perf_counter() - start)
+    results.append({"mode": "serial", "steps_per_s": serial})
+    print(f"{'serial':>12} | {serial:>10,.0f} | {1.0:>7.2f}x")
+
+    for num_workers in worker_counts:
+        with SharedMemoryVectorEnv(num_workers, total_envs // num_workers) as vec_env:
+            states = vec_env.reset()
+            start = time.perf_counter()
+            for _ in range(num_steps):
+                actions, _, _ = agent.select_actions(states)
+                states, _, _ = vec_env.step(actions)
+            throughput = num_steps * vec_env.num_envs / (time.perf_counter() - start)
+        mode = f"{num_workers} workers"
+        results.append({"mode": mode, "steps_per_s": throughput})
+        print(f"{mode:>12} | {throughput:>10,.0f} | {throughput / serial:>7.2f}x")
+    return results
+
+def benchmark_kl_early_stop(num_updates: int = 15, rollout_steps: int = 1024, num_epochs: int = 10,
+                            target_kls: List[Optional[float]] = (None, 0.02, 0.01)) -> List[Dict]:
+    """
+    KL 早停的效果: 相同的采样流程, 分别不早停 / 以不同 target_kl 早停,
+    统计 update() 的吞吐量 (次/秒, 只计更新时间)、平均运行轮数、省下的轮数与最后的平均奖励
+    """
+    results = []
+    print(f"\nKL 早停: {num_updates} 次更新, 每次 {rollout_steps} 步, 最多 {num_epochs} 轮")
+    print(f"{'target_kl':>9} | {'updates/s':>9} | {'epochs/update':>13} | {'epochs saved':>12} | "
+          f"{'approx KL':>9} | {'reward':>7}")
+    print("-" * 76)
+    for target_kl in target_kls:
+        config = PPOConfig(rollout_steps=rollout_steps, num_epochs=num_epochs, target_kl=target_kl, buffer="tensor")
+        torch.manual_seed(config.seed)
+        np.random.seed(config.seed)
+        env, agent = SimpleCartPoleEnv(), PPOAgent(config)
+        state, episode_reward, rewards = env.reset(), 0.0, []
+        update_time, epochs, kls = 0.0, [], []
+        for _ in range(num_updates):
+            for _ in range(rollout_steps):
+                action, log_prob, value = agent.select_action(state)
+                next_state, reward, done = env.step(action)
+                agent.buffer.add(state, action, log_prob, reward, value, done)
+                episode_reward += reward
+                state = next_state
+                if done:
+                    rewards.append(episode_reward)
+                    state, episode_reward = env.reset(), 0.0
+            _, _, last_value = agent.select_action(state)
+            agent.buffer.compute_returns_and_advantages(last_value, config.gamma, config.gae_lambda)
+            start = time.perf_counter()
+            logs = agent.update()
+            update_time += time.perf_counter() - start
+            epochs.append(logs["epochs"])
+            kls.append(logs["approx_kl"])
+        saved = num_epochs * num_updates - sum(epochs)
+        results.append({"target_kl": target_kl, "updates_per_s": num_updates / update_time,
+                        "mean_epochs": float(np.mean(epochs)), "epochs_saved": saved,
+                        "approx_kl": float(np.mean(kls)), "reward": float(np.mean(rewards[-20:]))})
+        print(f"{str(target_kl):>9} | {num_updates / update_time:>9.2f} | {np.mean(epochs):>13.1f} | "
+              f"{saved:>12} | {np.mean(kls):>9.4f} | {np.mean(rewards[-20:]):>7.1f}")
+    return results
+
+def check_staleness_correction(rollout_steps: int = 1024, perturbation: float = 0.5, seed: int = 0) -> Dict:
+    """
+    滞后修正的方向核对: 用策略 μ 采一批数据, 再把网络扰动成 π, 比较
+        未修正: 标准化优势 Â, 以 μ 为锚点
+        修正:   以 π 为锚点, 优势为 w ⊙ Â, w = min(1, π/μ)
+    修正应当只缩小 π 认为不太可能的样本 (w < 1) 的优势: 逐样本同号、幅度不增,
+    (w = 1 的样本保持不变), 因而这些样本对代理目标 E[w Â] 的贡献变小。
+    同时给出 "先乘权重再标准化" 的做法下符号被翻转的样本数作为对照。
+    """
+    config = PPOConfig(rollout_steps=rollout_steps, buffer="tensor", seed=seed)
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    agent = PPOAgent(config)
+    env = SimpleCartPoleEnv()
+    _collect_rollout(agent.network, env, agent.buffer, env.reset(), {"reward": 0.0, "finished": []}, config)
+    raw = agent.buffer.advantages.clone()
+    normalized = (raw - raw.mean()) / (raw.std() + 1e-8)
+    with torch.no_grad():
+        for p in agent.network.actor_head.parameters():
+            p.add_(perturbation * torch.randn_like(p))
+    mean_weight = agent.correct_behavior_policy()
+    weights = agent.buffer.importance_weights.clone()
+    agent.buffer.normalize_advantages()
+    corrected = agent.buffer.advantages
+
+    weighted_first = raw * weights
+    weighted_first = (weighted_first - weighted_first.mean()) / (weighted_first.std() + 1e-8)
+    downweighted = weights < 1.0
+    result = {
+        "mean_weight": mean_weight,
+        "downweighted": int(downweighted.sum()),
+        "sign_flips": int((torch.sign(corrected) != torch.sign(normalized)).sum()),
+        "sign_flips_weight_then_normalize": int((torch.sign(weighted_first) != torch.sign(normalized)).sum()),
+        "max_magnitude_increase": (corrected.abs() - normalized.abs()).max().item(),
+        "objective_uncorrected": normalized.mean().item(),
+        "objective_corrected": corrected.mean().item(),
+        "downweighted_uncorrected": normalized[downweighted].abs().sum().item(),
+        "downweighted_corrected": corrected[downweighted].abs().sum().item(),
+    }
+    assert result["sign_flips"] == 0 and result["max_magnitude_increase"] <= 1e-6
+    assert result["downweighted_corrected"] < result["downweighted_uncorrected"]
+    assert torch.equal(corrected[~downweighted], normalized[~downweighted])
+    print(f"\n滞后修正核对: {result['downweighted']}/{len(weights)} 个样本 w < 1, 平均 w = {mean_weight:.3f}")
+    print(f"  修正后符号翻转: {result['sign_flips']} (先加权再标准化: {result['sign_flips_weight_then_normalize']})")
+    print(f"  代理目标 E[A]: 未修正 {result['objective_uncorrected']:+.4f} → 修正 {result['objective_corrected']:+.4f}; "
+          f"w < 1 样本的 Σ|A|: {result['downweighted_uncorrected']:.1f} → {result['downweighted_corrected']:.1f}")
+    return result
+
+def benchmark_double_buffered(num_updates: int = 20, rollout_steps: int = 1024) -> List[Dict]:
+    """
+    交替执行 vs 双缓冲异步 (带/不带滞后修正): 墙钟时间、样本吞吐量、滞后分布、
+    修正时的平均重要性权重, 以及最后 20 个回合的平均奖励
+    """
+    config = PPOConfig(num_updates=num_updates, rollout_steps=rollout_steps)
+    results = []
+    print(f"\n双缓冲 PPO: {num_updates} 次更新, 每次 {rollout_steps} 步, CPU 核数 = {os.cpu_count()}")
+    print(f"{'mode':>20} | {'wall':>7} | {'samples/s':>9} | {'speedup':>8} | {'staleness':>12} | "
+          f"{'mean w':>7} | {'reward':>7}")
+    print("-" * 90)
+    base = None
+    for name, asynchronous, correct in (("alternating", False, False), ("async", True, False),
+                                        ("async + correction", True, True)):
+        run = train_ppo_double_buffered(config, asynchronous, correct, verbose=False)
+        base = base or run["elapsed_s"]
+        lags = {lag: run["staleness"].count(lag) for lag in sorted(set(run["staleness"]))}
+        mean_w = np.mean(run["importance_weights"]) if run["importance_weights"] else float("nan")
+        reward = np.mean(run["rewards"][-20:])
+        results.append({"mode": name, "elapsed_s": run["elapsed_s"], "samples_per_s": run["samples_per_s"],
+                        "staleness": lags, "mean_weight": mean_w, "reward": reward})
+        print(f"{name:>20} | {run['elapsed_s']:>6.2f}s | {run['samples_per_s']:>9,.0f} | "
+              f"{base / run['elapsed_s']:>7.2f}x | {str(lags):>12} | {mean_w:>7.3f} | {reward:>7.1f}")
+    return results
+
 # ============================================
 # 第八部分: 可视化
 # ============================================
@@ -589,7 +1473,8 @@ if __name__ == "__main__":
         num_updates=50,
         rollout_steps=512,
         num_epochs=4,
-        clip_epsilon=0.2
+        clip_epsilon=0.2,
+        buffer="tensor"
     )
     
     results = train_ppo(config)
@@ -599,3 +1484,12 @@ if __name__ == "__main__":
     print("训练完成!")
     print(f"最终平均奖励: {np.mean(results['rewards'][-20:]):.1f}")
     print("=" * 60)
+
+    benchmark_action_selection()
+    benchmark_rollout_buffer()
+    benchmark_gae()
+    benchmark_vector_env()
+    benchmark_kl_early_stop()
+    check_staleness_correction()
+    benchmark_double_buffered()
+    train_ppo_vectorized(PPOConfig(num_updates=30, rollout_steps=512), num_workers=2, envs_per_worker=4)
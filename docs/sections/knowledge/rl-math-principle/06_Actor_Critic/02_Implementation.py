@@ -14,11 +14,14 @@ L_value = (V(s) - Target)^2
 L_total = L_policy + 0.5 * L_value - 0.01 * Entropy
 """
 
+import functools
+import importlib.util
+from pathlib import Path
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-import numpy as np
-from typing import List, Tuple
+from typing import List
 
 class ActorCritic(nn.Module):
     def __init__(self, state_dim, action_dim, hidden_dim=128):
@@ -87,6 +90,19 @@ def compute_a2c_loss(
         "entropy": entropy.item()
     }
 
+@functools.lru_cache(maxsize=None)
+def _load_ppo_implementation():
+    """
+    GAE 引擎 compute_gae_batched 定义在 05_PPO/02_Implementation.py, 两章共用同一份实现。
+    章节目录不是 Python 包, 因此按文件路径加载; 只在第一次调用 compute_gae 时执行,
+    导入本章不会运行 PPO 章节。
+    """
+    path = Path(__file__).resolve().parent.parent / "05_PPO" / "02_Implementation.py"
+    spec = importlib.util.spec_from_file_location("_ppo_implementation", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
 def compute_gae(
     rewards: List[float], 
     values: List[float], 
@@ -98,19 +114,15 @@ def compute_gae(
     广义优势估计 (GAE)
     A_t = delta_t + gamma * lambda * A_{t+1}
     delta_t = r_t + gamma * V_{t+1} - V_t
-    """
-    gae = 0
-    returns = []
     
-    # 从后往前遍历
-    values = values + [next_value] # Append V_last
+    单条轨迹即 05_PPO 的 [T, num_envs] 批量 GAE (compute_gae_batched) 在 num_envs = 1 时的特例,
+    返回 [T, 1] 的目标价值
+    """
+    rewards = torch.tensor(rewards, dtype=torch.float32).unsqueeze(1)
+    values = torch.tensor(values, dtype=torch.float32).unsqueeze(1)
     
-    for t in reversed(range(len(rewards))):
-        delta = rewards[t] + gamma * values[t+1] - values[t]
-        gae = delta + gamma * lam * gae
-        
-        # Return = Advantage + Value
-        ret = gae + values[t]
-        returns.insert(0, ret)
-        
-    return torch.tensor(returns).float().unsqueeze(1)
+    # Return = Advantage + Value
+    compute_gae_batched = _load_ppo_implementation().compute_gae_batched
+    _, returns = compute_gae_batched(rewards, values, torch.tensor([next_value], dtype=torch.float32),
+                                     gamma=gamma, gae_lambda=lam)
+    return returns